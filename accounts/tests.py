@@ -1,8 +1,14 @@
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from accounts.form import CustomUserRegistrationForm
 
 
@@ -374,3 +380,42 @@ class ProfileEditTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertFormError(response, 'form', 'user_photo', 'Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
 
+
+
+@override_settings(AUTHENTICATION_BACKENDS=['accounts.backends.CachedModelBackend'],
+                   SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@example.com', password='testpassword123',
+                                                   first_name='Test', last_name='User')
+        self.client.login(username='testuser', password='testpassword123')
+        self.profile_url = reverse('accounts:profile')
+
+    def test_user_and_session_served_from_cache(self):
+        self.client.get(self.profile_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.profile_url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_profile_edit_invalidates_cached_user(self):
+        self.client.get(self.profile_url)
+        response = self.client.post(reverse('accounts:profile_edit'), {
+            'username': 'testuser', 'email': 'test@example.com', 'first_name': 'Updated', 'last_name': 'User',
+        })
+        self.assertRedirects(response, self.profile_url)
+        self.assertContains(self.client.get(self.profile_url), 'Updated')
+
+
+class CleanupSessionsCommandTest(TestCase):
+
+    def test_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=now - timezone.timedelta(days=1))
+        Session.objects.create(session_key='active', session_data='', expire_date=now + timezone.timedelta(days=1))
+        out = StringIO()
+        call_command('cleanup_sessions', batch_size=2, stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['active'])
+        self.assertIn('5 expired sessions deleted', out.getvalue())
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from books.models import Book, Category, SubCategory, BookShowed
+from books.models import Book, Category, SubCategory, BookShowed, Job
 
 admin.site.register(Book)
 admin.site.register(Category)
 admin.site.register(SubCategory)
-admin.site.register(BookShowed)
\ No newline at end of file
+admin.site.register(BookShowed)
+admin.site.register(Job)
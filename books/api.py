@@ -0,0 +1,101 @@
+from django.urls import reverse
+
+from books.models import SubCategory
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Public field name -> ORM path, read straight from values() rows.
+BOOK_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'author': 'author',
+    'description': 'description',
+    'year': 'year',
+    'pages': 'pages',
+    'isbn': 'isbn',
+    'isbn13': 'isbn13',
+    'url': 'url',
+    'size': 'size',
+    'category': 'category_id',
+    'category_name': 'category__name',
+    'sub_category': 'sub_category_id',
+    'sub_category_name': 'sub_category__name',
+    'views_count': 'views_count',
+    'downloads_count': 'downloads_count',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+# Fields that need a model instance: the model fields to load and a getter.
+BOOK_COMPUTED_FIELDS = {
+    'image': (['image'], lambda book: book.image.url if book.image else None),
+    'download_url': (['file'], lambda book: reverse('books:book_download', args=[book.pk]) if book.file else None),
+}
+DEFAULT_BOOK_FIELDS = ('id', 'title', 'author', 'year', 'category', 'views_count', 'downloads_count')
+CATEGORY_FIELDS = ('id', 'name', 'book_count')
+SUB_CATEGORY_FIELDS = {'id': 'id', 'name': 'name', 'category': 'category_id'}
+
+
+def parse_fields(value, available, default):
+    if not value:
+        return list(default)
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def parse_page_size(value):
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+
+def resolve(obj, path):
+    for name in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, name)
+    return obj
+
+
+class BookSerializer:
+    def __init__(self, fields):
+        self.fields = fields
+        self.needs_instances = any(name in BOOK_COMPUTED_FIELDS for name in fields)
+
+    def prepare(self, queryset, extra=()):
+        # extra names columns the caller needs besides the requested fields,
+        # such as the paginator's ordering keys.
+        paths = [BOOK_FIELDS[name] for name in self.fields if name in BOOK_FIELDS]
+        if not self.needs_instances:
+            return queryset.values(*dict.fromkeys(['id', *paths, *extra]))
+        load = [path[:-3] if path.endswith('_id') else path for path in paths]
+        for name in self.fields:
+            if name in BOOK_COMPUTED_FIELDS:
+                load += BOOK_COMPUTED_FIELDS[name][0]
+        load += [name for name in extra if name not in queryset.query.annotations]
+        related = {path.split('__')[0] for path in paths if '__' in path}
+        return queryset.select_related(*related).only(*dict.fromkeys(load))
+
+    def serialize(self, obj):
+        if isinstance(obj, dict):
+            return {name: obj[BOOK_FIELDS[name]] for name in self.fields}
+        return {
+            name: BOOK_COMPUTED_FIELDS[name][1](obj) if name in BOOK_COMPUTED_FIELDS else resolve(obj, BOOK_FIELDS[name])
+            for name in self.fields
+        }
+
+
+def serialize_categories(categories, fields):
+    return [{name: category[name] for name in fields} for category in categories]
+
+
+def get_sub_categories(fields, category_id=None):
+    queryset = SubCategory.objects.order_by('id')
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    rows = queryset.values(*(SUB_CATEGORY_FIELDS[name] for name in fields))
+    return [{name: row[SUB_CATEGORY_FIELDS[name]] for name in fields} for row in rows]
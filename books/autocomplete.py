@@ -0,0 +1,228 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from books.cache import cache_timeout
+from books.models import Book
+from books.search import tokenize
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+MIN_QUERY_LENGTH = 2
+KINDS = ('title', 'author')
+
+# Book changes are published as a numbered log in the shared cache, so every
+# worker can patch its own index instead of rebuilding it.
+CHANGES_KEY = 'autocomplete:changes'
+CHANGE_KEY = 'autocomplete:change:{}'
+CHANGE_TIMEOUT = 24 * 60 * 60
+REBUILD = '*'
+MAX_PATCHED_CHANGES = 1000
+
+logger = logging.getLogger('books.autocomplete')
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+def suffixes(key):
+    # "the lord of the rings" is also found by typing "lord" or "rings".
+    words = key.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def latest_change():
+    # Time-based start, like the cache generations: a log that was evicted
+    # never counts up to a number a worker has already seen.
+    number = cache.get(CHANGES_KEY)
+    if number is None:
+        cache.add(CHANGES_KEY, time.time_ns(), timeout=None)
+        number = cache.get(CHANGES_KEY)
+    return number or 0
+
+
+def record_change(book_id=REBUILD):
+    cache.add(CHANGES_KEY, time.time_ns(), timeout=None)
+    try:
+        number = cache.incr(CHANGES_KEY)
+    except ValueError:
+        return
+    cache.set(CHANGE_KEY.format(number), book_id, timeout=CHANGE_TIMEOUT)
+
+
+def add_book(books, entries, pk, title, author, score):
+    # Returns the index keys of the entries the book created.
+    books[pk] = (title, author, score)
+    keys = []
+    for kind, text in zip(KINDS, (title, author)):
+        key = normalize(text)
+        if not key:
+            continue
+        entry = entries.get((kind, key))
+        if entry is None:
+            # [display text, popularity, number of books]
+            entry = entries[(kind, key)] = [text.strip(), 0, 0]
+            keys += [(suffix, kind, key) for suffix in suffixes(key)]
+        entry[1] += score
+        entry[2] += 1
+    return keys
+
+
+def build_index():
+    books = {}
+    entries = {}
+    keys = []
+    rows = Book.objects.values_list('pk', 'title', 'author', 'views_count').iterator(chunk_size=2000)
+    for row in rows:
+        keys += add_book(books, entries, *row)
+    keys.sort()
+    return books, entries, keys
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        self._built_at = None
+        self._seen = 0
+        self._books = {}
+        self._entries = {}
+        self._keys = []
+        self._results = {}
+
+    @property
+    def background(self):
+        return getattr(settings, 'BOOK_AUTOCOMPLETE_BACKGROUND', True)
+
+    @property
+    def max_age(self):
+        # Without a shared cache the change log only holds this worker's
+        # saves, the others are picked up by rebuilding more often.
+        return cache_timeout(settings.BOOK_AUTOCOMPLETE_MAX_AGE)
+
+    def invalidate(self):
+        record_change(REBUILD)
+
+    def _add(self, *row):
+        for key in add_book(self._books, self._entries, *row):
+            bisect.insort(self._keys, key)
+
+    def _remove(self, pk):
+        if pk not in self._books:
+            return
+        title, author, score = self._books.pop(pk)
+        for kind, text in zip(KINDS, (title, author)):
+            key = normalize(text)
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                continue
+            entry[1] -= score
+            entry[2] -= 1
+            if not entry[2]:
+                del self._entries[(kind, key)]
+                for suffix in suffixes(key):
+                    index = bisect.bisect_left(self._keys, (suffix, kind, key))
+                    if index < len(self._keys) and self._keys[index] == (suffix, kind, key):
+                        del self._keys[index]
+
+    def _rebuild(self, seen, built_at):
+        # The new index is built without holding the lock, lookups keep
+        # using the old one until it is swapped in.
+        with self._build_lock:
+            try:
+                if self._built_at != built_at:
+                    # Another request rebuilt it while this one waited.
+                    return
+                books, entries, keys = build_index()
+                with self._lock:
+                    self._books, self._entries, self._keys = books, entries, keys
+                    self._seen = seen
+                    self._built_at = time.monotonic()
+                    self._results = {}
+            finally:
+                self._rebuilding = False
+
+    def _run_rebuild(self, seen, built_at):
+        try:
+            self._rebuild(seen, built_at)
+        except Exception:
+            logger.exception('Could not rebuild the autocomplete index')
+        finally:
+            connections.close_all()
+
+    def _refresh(self, pks, seen):
+        rows = list(Book.objects.filter(pk__in=pks).values_list('pk', 'title', 'author', 'views_count'))
+        for pk in pks:
+            self._remove(pk)
+        for row in rows:
+            self._add(*row)
+        self._seen = seen
+        self._results = {}
+
+    def _sync(self):
+        # Applies pending changes and returns the change number to rebuild
+        # from when they cannot be patched in.
+        if self._rebuilding:
+            return None
+        latest = latest_change()
+        if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+            # Popularity moves without Book saves, so scores are refreshed
+            # by a periodic rebuild.
+            return latest
+        if latest == self._seen:
+            return None
+        pending = latest - self._seen
+        changes = {}
+        if 0 < pending <= MAX_PATCHED_CHANGES:
+            changes = cache.get_many([CHANGE_KEY.format(n) for n in range(self._seen + 1, latest + 1)])
+        if len(changes) != pending or REBUILD in changes.values():
+            return latest
+        self._refresh(set(changes.values()), latest)
+        return None
+
+    def _update(self):
+        with self._lock:
+            seen = self._sync()
+            if seen is None:
+                return
+            built_at = self._built_at
+            if built_at is not None and self.background:
+                # Requests are answered from the old index meanwhile.
+                self._rebuilding = True
+                threading.Thread(target=self._run_rebuild, args=(seen, built_at), name='autocomplete-index',
+                                 daemon=True).start()
+                return
+        self._rebuild(seen, built_at)
+
+    def complete(self, q, kind=None, limit=DEFAULT_LIMIT):
+        key = normalize(q)
+        if len(key) < MIN_QUERY_LENGTH:
+            return []
+        self._update()
+        with self._lock:
+            if (key, kind, limit) in self._results:
+                return self._results[(key, kind, limit)]
+            matches = set()
+            index = bisect.bisect_left(self._keys, (key,))
+            while index < len(self._keys) and self._keys[index][0].startswith(key):
+                _, entry_kind, entry_key = self._keys[index]
+                if kind is None or entry_kind == kind:
+                    matches.add((entry_kind, entry_key))
+                index += 1
+            best = heapq.nlargest(limit, matches, key=lambda match: (self._entries[match][1], -len(match[1])))
+            results = [{'text': self._entries[match][0], 'kind': match[0]} for match in best]
+            if len(self._results) >= 1000:
+                self._results = {}
+            self._results[(key, kind, limit)] = results
+            return results
+
+
+autocomplete_index = PrefixIndex()
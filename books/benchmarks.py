@@ -0,0 +1,224 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import AsyncRequestFactory, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from books.buffers import book_showed_buffer
+from books.models import Book, Category
+from books.views import (AsyncBookDetailView, AsyncBookListView, AsyncCategoryBookListView, BookDetailView,
+                         BookListView, CategoryBookListView)
+
+CustomUser = get_user_model()
+
+BENCHMARK_USERNAME = 'benchmark_user'
+BENCHMARK_PASSWORD = 'Benchmark123!'
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'books-benchmark',
+    }
+}
+
+
+@contextmanager
+def isolated_state():
+    # Benchmarks run against a test database. Their cache entries, generation
+    # bumps and buffered views must not reach the real cache or, through the
+    # exit-time buffer flush, the real database.
+    with override_settings(CACHES=BENCHMARK_CACHES, BOOK_GENERATION_CACHE=True, BOOK_VIEW_BUFFER_BACKGROUND=False):
+        try:
+            yield
+        finally:
+            book_showed_buffer.clear()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def response_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def prepare_fixtures(file_size=1024 * 1024):
+    user, created = CustomUser.objects.get_or_create(username=BENCHMARK_USERNAME,
+                                                     defaults={'email': 'benchmark@example.com'})
+    if created:
+        user.set_password(BENCHMARK_PASSWORD)
+        user.save()
+    book = Book.objects.order_by('-views_count', 'id').first()
+    if book is not None and not book.file:
+        book.file.save('benchmark.pdf', ContentFile(b'%PDF' + b'0' * (file_size - 4)))
+    return book
+
+
+def get_endpoints(book):
+    category = Category.objects.order_by('id').first()
+    endpoints = [
+        ('book_list', reverse('books:book_list'), {}, False),
+        ('book_list_search', reverse('books:book_list'), {'q': book.title.split()[0]}, False),
+        ('book_list_deep', reverse('books:book_list'), {'cursor': 'last'}, False),
+        ('category_book_list', reverse('books:category_book_list', args=[category.pk]), {}, False),
+        ('book_detail', reverse('books:book_detail', args=[book.pk]), {}, False),
+        ('book_detail_authenticated', reverse('books:book_detail', args=[book.pk]), {}, True),
+        ('download_book', reverse('books:book_download', args=[book.pk]), {}, True),
+    ]
+    return endpoints
+
+
+def measure(client, path, params, iterations, warmup):
+    for _ in range(warmup):
+        response_size(client.get(path, params))
+    latencies = []
+    queries = []
+    sizes = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            request_started = time.perf_counter()
+            response = client.get(path, params)
+            size = response_size(response)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{path} answered {response.status_code}')
+        queries.append(len(context.captured_queries))
+        sizes.append(size)
+    elapsed = time.perf_counter() - started
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'throughput_rps': round(iterations / elapsed, 2) if elapsed else None,
+        'queries': max(queries),
+        'bytes': max(sizes),
+    }
+
+
+def run_benchmarks(iterations=50, warmup=5, endpoints=None):
+    with isolated_state():
+        return _run_benchmarks(iterations, warmup, endpoints)
+
+
+def _run_benchmarks(iterations, warmup, endpoints):
+    book = prepare_fixtures()
+    if book is None:
+        raise RuntimeError('The benchmark needs at least one book')
+    anonymous = Client()
+    authenticated = Client()
+    authenticated.login(username=BENCHMARK_USERNAME, password=BENCHMARK_PASSWORD)
+    cache.clear()
+
+    results = {}
+    for name, path, params, login in get_endpoints(book):
+        if endpoints and name not in endpoints:
+            continue
+        client = authenticated if login else anonymous
+        results[name] = measure(client, path, params, iterations, warmup)
+    return results
+
+
+def compare_results(baseline, current, threshold=0.2):
+    regressions = []
+    for name, before in baseline.items():
+        after = current.get(name)
+        if after is None:
+            continue
+        if after['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {after['p95_ms']}ms")
+        if after['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {after['queries']}")
+    return regressions
+
+
+def get_view_pairs(book):
+    category = Category.objects.order_by('id').first()
+    return [
+        ('book_list', BookListView, AsyncBookListView, reverse('books:book_list'), {}),
+        ('category_book_list', CategoryBookListView, AsyncCategoryBookListView,
+         reverse('books:category_book_list', args=[category.pk]), {'category_id': category.pk}),
+        ('book_detail', BookDetailView, AsyncBookDetailView,
+         reverse('books:book_detail', args=[book.pk]), {'pk': book.pk}),
+    ]
+
+
+def summarize(latencies, elapsed):
+    return {
+        'iterations': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+
+def measure_sync_view(view, path, kwargs, iterations, concurrency):
+    factory = RequestFactory()
+
+    def call(_):
+        request = factory.get(path)
+        request.user = AnonymousUser()
+        started = time.perf_counter()
+        response = view(request, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{path} answered {response.status_code}')
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, range(iterations)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def measure_async_view(view, path, kwargs, iterations, concurrency):
+    factory = AsyncRequestFactory()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            request = factory.get(path)
+            request.user = AnonymousUser()
+            started = time.perf_counter()
+            response = await view(request, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{path} answered {response.status_code}')
+            return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(call() for _ in range(iterations)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run_async_comparison(iterations=50, concurrency=10):
+    with isolated_state():
+        return _run_async_comparison(iterations, concurrency)
+
+
+def _run_async_comparison(iterations, concurrency):
+    book = prepare_fixtures()
+    if book is None:
+        raise RuntimeError('The benchmark needs at least one book')
+
+    results = {}
+    for name, sync_view, async_view, path, kwargs in get_view_pairs(book):
+        cache.clear()
+        sync_result = measure_sync_view(sync_view.as_view(), path, kwargs, iterations, concurrency)
+        cache.clear()
+        async_result = async_to_sync(measure_async_view)(async_view.as_view(), path, kwargs, iterations,
+                                                         concurrency)
+        results[name] = {'sync': sync_result, 'async': async_result}
+    return results
@@ -0,0 +1,123 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from books.cache import bump_generation
+from accounts.models import CustomUser
+from books.models import Book, BookShowed
+
+logger = logging.getLogger('books.buffers')
+
+
+class BookShowedBuffer:
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._wake = threading.Event()
+        self._flusher = None
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'BOOK_VIEW_BUFFER_SIZE', 100)
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'BOOK_VIEW_BUFFER_INTERVAL', 5)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'BOOK_VIEW_BUFFER_MAX_PENDING', 10000)
+
+    @property
+    def background(self):
+        return getattr(settings, 'BOOK_VIEW_BUFFER_BACKGROUND', True)
+
+    def add(self, book_id, user_id):
+        with self._lock:
+            self._events.append((book_id, user_id))
+            full = len(self._events) >= self.max_size
+            due = full or time.monotonic() - self._last_flush >= self.max_age
+        if self.background:
+            # The request only queues the event; the flusher thread pays for
+            # the inserts and also drains the buffer when no requests come.
+            self._start_flusher()
+            if full:
+                self._wake.set()
+        elif due:
+            self.flush()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run_flusher, name='book-showed-buffer', daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            self._wake.wait(max(self.max_age, 1))
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush buffered book views')
+            finally:
+                connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+            self._last_flush = time.monotonic()
+        if not events:
+            return 0
+
+        try:
+            events = self._write(events)
+        except Exception:
+            self._requeue(events)
+            raise
+        bump_generation('counters')
+        return len(events)
+
+    def _write(self, events):
+        books = set(Book.objects.filter(pk__in={book_id for book_id, _ in events}).values_list('pk', flat=True))
+        users = set(CustomUser.objects.filter(pk__in={user_id for _, user_id in events}).values_list('pk', flat=True))
+        events = [(book_id, user_id) for book_id, user_id in events if book_id in books and user_id in users]
+        with transaction.atomic():
+            BookShowed.objects.bulk_create(
+                [BookShowed(book_id=book_id, user_id=user_id) for book_id, user_id in events],
+                batch_size=self.max_size,
+            )
+            # bulk_create skips post_save, so keep Book.views_count in step here.
+            for book_id, views in Counter(book_id for book_id, _ in events).items():
+                Book.objects.filter(pk=book_id).update(views_count=F('views_count') + views)
+        return events
+
+    def _requeue(self, events):
+        # The events go back in front of the ones added meanwhile, so the next
+        # flush retries them. While the database stays down only the newest
+        # max_pending are kept.
+        with self._lock:
+            self._events = events + self._events
+            dropped = len(self._events) - self.max_pending
+            if dropped > 0:
+                del self._events[:dropped]
+        if dropped > 0:
+            logger.warning('Dropped %d buffered book views', dropped)
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+
+    def __len__(self):
+        return len(self._events)
+
+
+book_showed_buffer = BookShowedBuffer()
+atexit.register(book_showed_buffer.flush)
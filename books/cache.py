@@ -0,0 +1,95 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_TIMEOUT = 60 * 60
+GENERATION_KEY = 'books:generation:{}'
+
+
+def _new_generation():
+    # Time-based so a generation key that was evicted never restarts at a
+    # value that older fragments were stored under.
+    return time.time_ns()
+
+
+def generations_shared():
+    return settings.BOOK_GENERATION_CACHE
+
+
+def cache_timeout(timeout):
+    # A bump only reaches the worker that made it when the cache is per
+    # process, so generations and versioned values expire after a short
+    # while there and other workers catch up on their own.
+    if generations_shared():
+        return timeout
+    local_timeout = settings.BOOK_LOCAL_CACHE_TIMEOUT
+    return local_timeout if timeout is None else min(timeout, local_timeout)
+
+
+def get_generations(*names):
+    keys = {GENERATION_KEY.format(name): name for name in names}
+    found = cache.get_many(keys)
+    generations = {}
+    for key, name in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            cache.add(key, _new_generation(), cache_timeout(None))
+            generation = cache.get(key)
+        generations[name] = generation
+    return generations
+
+
+async def aget_generations(*names):
+    keys = {GENERATION_KEY.format(name): name for name in names}
+    found = await cache.aget_many(keys)
+    generations = {}
+    for key, name in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            await cache.aadd(key, _new_generation(), cache_timeout(None))
+            generation = await cache.aget(key)
+        generations[name] = generation
+    return generations
+
+
+def format_version(generations, names):
+    return '.'.join(str(generations[name]) for name in names)
+
+
+def get_version(*names):
+    return format_version(get_generations(*names), names)
+
+
+async def aget_version(*names):
+    return format_version(await aget_generations(*names), names)
+
+
+def bump_generation(name):
+    key = GENERATION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_generation(), cache_timeout(None))
+
+
+def versioned_key(key, generations):
+    return f'books:{key}:{get_version(*generations)}'
+
+
+def cached(key, builder, generations=('books',), timeout=DEFAULT_TIMEOUT):
+    cache_key = versioned_key(key, generations)
+    value = cache.get(cache_key)
+    if value is None:
+        value = builder()
+        cache.set(cache_key, value, cache_timeout(timeout))
+    return value
+
+
+async def acached(key, builder, generations=('books',), timeout=DEFAULT_TIMEOUT):
+    cache_key = f'books:{key}:{format_version(await aget_generations(*generations), generations)}'
+    value = await cache.aget(cache_key)
+    if value is None:
+        value = await builder()
+        await cache.aset(cache_key, value, cache_timeout(timeout))
+    return value
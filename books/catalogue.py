@@ -0,0 +1,143 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import EmptyPage, PageNotAnInteger
+
+from books.isbn import normalize_isbn, to_isbn13
+from books.models import Book
+from books.pagination import CursorPaginator
+from books.search import get_search_backend
+from books.stats import TRENDING_WINDOWS, annotate_trending
+
+# Every ordering is backed by a (key, id) index on Book plus (category, key, id)
+# and (sub_category, key, id) variants, see Book.Meta.indexes. The trending
+# orderings sum BookDailyStats rows through its (day, book) index.
+ORDERINGS = {
+    'popular': ('-views_count', '-id'),
+    'newest': ('-created_at', '-id'),
+    'year': ('-year', '-id'),
+    'title': ('title', 'id'),
+    'trending_7d': ('-trend_views', '-id'),
+    'trending_30d': ('-trend_views', '-id'),
+}
+DEFAULT_ORDERING = 'popular'
+FILTER_PARAMS = ('category', 'sub_category', 'year', 'year_from', 'year_to', 'title', 'author', 'isbn', 'q',
+                 'ordering')
+SEARCH_ORDERING = ('-rank', '-views_count', '-id')
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class CatalogueFilter:
+    category_id: Optional[int] = None
+    sub_category_id: Optional[int] = None
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    title: str = ''
+    author: str = ''
+    isbn: str = ''
+    q: str = ''
+    ordering: str = DEFAULT_ORDERING
+
+    def __post_init__(self):
+        if self.ordering not in ORDERINGS:
+            object.__setattr__(self, 'ordering', DEFAULT_ORDERING)
+
+    @classmethod
+    def from_query_params(cls, params, **overrides):
+        year = parse_int(params.get('year'))
+        spec = cls(
+            category_id=parse_int(params.get('category')),
+            sub_category_id=parse_int(params.get('sub_category')),
+            year_from=year if year is not None else parse_int(params.get('year_from')),
+            year_to=year if year is not None else parse_int(params.get('year_to')),
+            title=params.get('title', '').strip(),
+            author=params.get('author', '').strip(),
+            isbn=normalize_isbn(params.get('isbn')) or '',
+            q=params.get('q', '').strip(),
+            ordering=params.get('ordering', DEFAULT_ORDERING),
+        )
+        if spec.q and not spec.isbn and to_isbn13(spec.q):
+            # Someone pasted an ISBN into the search box; an exact lookup
+            # beats ranking it against titles.
+            spec = replace(spec, q='', isbn=normalize_isbn(spec.q))
+        return replace(spec, **overrides)
+
+    @property
+    def order_by(self):
+        if self.q:
+            return SEARCH_ORDERING
+        return ORDERINGS[self.ordering]
+
+
+def normalize_query_params(params):
+    return urlencode(sorted(
+        (key, params[key].strip()) for key in FILTER_PARAMS if params.get(key, '').strip()
+    ))
+
+
+def get_catalogue_queryset(spec):
+    queryset = Book.objects.all()
+    if spec.category_id is not None:
+        queryset = queryset.filter(category_id=spec.category_id)
+    if spec.sub_category_id is not None:
+        queryset = queryset.filter(sub_category_id=spec.sub_category_id)
+    if spec.year_from is not None:
+        queryset = queryset.filter(year__gte=spec.year_from)
+    if spec.year_to is not None:
+        queryset = queryset.filter(year__lte=spec.year_to)
+    if spec.ordering == 'newest' and not spec.q:
+        # NULL created_at rows cannot be keyset-paginated consistently across backends.
+        queryset = queryset.filter(created_at__isnull=False)
+    if spec.ordering in TRENDING_WINDOWS and not spec.q:
+        queryset = annotate_trending(queryset, TRENDING_WINDOWS[spec.ordering])
+
+    search = get_search_backend()
+    if spec.title:
+        queryset = search.filter(queryset, 'title', spec.title)
+    if spec.author:
+        queryset = search.filter(queryset, 'author', spec.author)
+    if spec.isbn:
+        isbn13 = to_isbn13(spec.isbn)
+        if isbn13:
+            # Served by the book_isbn13_unique index, and matches the
+            # ISBN-10 and ISBN-13 forms alike.
+            queryset = queryset.filter(isbn13=isbn13)
+        else:
+            queryset = queryset.filter(isbn__icontains=spec.isbn)
+    if spec.q:
+        queryset = search.search(queryset, spec.q)
+    return queryset.order_by(*spec.order_by)
+
+
+def paginate_catalogue(spec, cursor=None, per_page=6):
+    paginator = CursorPaginator(get_catalogue_queryset(spec), per_page, ordering=spec.order_by)
+    try:
+        return paginator.page(cursor)
+    except PageNotAnInteger:
+        return paginator.first_page()
+    except EmptyPage:
+        return paginator.last_page()
+
+
+async def apaginate_catalogue(spec, cursor=None, per_page=6):
+    if spec.q:
+        # The Python search fallback reads its index synchronously.
+        queryset = await sync_to_async(get_catalogue_queryset)(spec)
+    else:
+        queryset = get_catalogue_queryset(spec)
+    paginator = CursorPaginator(queryset, per_page, ordering=spec.order_by)
+    try:
+        return await paginator.apage(cursor)
+    except PageNotAnInteger:
+        return await paginator.afirst_page()
+    except EmptyPage:
+        return await paginator.alast_page()
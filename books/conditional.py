@@ -0,0 +1,43 @@
+import hashlib
+
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+BOOK_GENERATIONS = ('books', 'categories')
+CATALOGUE_GENERATIONS = ('books', 'categories', 'counters')
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def catalogue_etag(spec, cursor, user_id, version):
+    return make_etag('catalogue', spec, cursor, user_id, version)
+
+
+def book_etag(book, user_id, version):
+    return make_etag('book', book.pk, book.updated_at, book.views_count, book.downloads_count, user_id, version)
+
+
+def has_pending_messages(request):
+    return bool(len(messages.get_messages(request)))
+
+
+def not_modified(request, etag, last_modified=None):
+    # Views pass etag=None for responses that must always be rendered, such
+    # as pages carrying flash messages.
+    if etag is None:
+        return None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified=None):
+    if etag is not None:
+        response.headers['ETag'] = etag
+    if etag is not None and last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    # Pages are per user and must be revalidated on every visit.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,130 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.utils.text import slugify
+
+from books.storage import sha256_from_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    # Only single byte ranges are honoured; anything else falls back to a
+    # full 200 response, which RFC 9110 allows.
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        suffix = int(end)
+        if suffix == 0:
+            raise RangeNotSatisfiable
+        return max(size - suffix, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def get_validators(fieldfile):
+    size = fieldfile.size
+    modified = int(fieldfile.storage.get_modified_time(fieldfile.name).timestamp())
+    return f'"{size:x}-{modified:x}"', modified
+
+
+def if_range_matches(request, etag, modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == modified
+
+
+def get_requested_range(request, size, etag, modified):
+    header = request.headers.get('Range')
+    if not header or not if_range_matches(request, etag, modified):
+        return None
+    return parse_range(header, size)
+
+
+def is_resumed_download(request):
+    match = RANGE_RE.match(request.headers.get('Range', '').strip())
+    if not match:
+        return False
+    start, end = match.groups()
+    if not start:
+        return bool(end)
+    return int(start) > 0
+
+
+def iter_file_range(fieldfile, start, length):
+    with fieldfile.open('rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload_response(fieldfile, filename, content_type):
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    if settings.BOOK_DOWNLOAD_OFFLOAD == 'nginx':
+        response['X-Accel-Redirect'] = settings.BOOK_DOWNLOAD_ACCEL_PREFIX + fieldfile.name
+    else:
+        response['X-Sendfile'] = fieldfile.path
+    return response
+
+
+def attachment_name(fieldfile, title):
+    # Content-addressed names are hashes, so offer the title instead.
+    if sha256_from_name(fieldfile.name):
+        return f'{slugify(title) or "book"}{os.path.splitext(fieldfile.name)[1]}'
+    return os.path.basename(fieldfile.name)
+
+
+def file_download_response(request, fieldfile, filename=None):
+    filename = filename or os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if settings.BOOK_DOWNLOAD_OFFLOAD:
+        return offload_response(fieldfile, filename, content_type)
+
+    etag, modified = get_validators(fieldfile)
+    size = fieldfile.size
+    try:
+        byte_range = get_requested_range(request, size, etag, modified)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(fieldfile.open('rb'), as_attachment=True, filename=filename,
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(iter_file_range(fieldfile, start, length), status=206,
+                                         content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    return response
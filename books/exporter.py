@@ -0,0 +1,136 @@
+import csv
+import datetime
+import json
+import zlib
+
+from django.utils import timezone
+
+from books.models import Book, BookDownloaded, BookShowed
+
+CHUNK_SIZE = 2000
+FLUSH_SIZE = 64 * 1024
+
+DATASETS = {
+    'books': (Book, [
+        ('id', 'id'),
+        ('title', 'title'),
+        ('author', 'author'),
+        ('description', 'description'),
+        ('year', 'year'),
+        ('pages', 'pages'),
+        ('isbn', 'isbn'),
+        ('isbn13', 'isbn13'),
+        ('category', 'category__name'),
+        ('sub_category', 'sub_category__name'),
+        ('url', 'url'),
+        ('file', 'file'),
+        ('size', 'size'),
+        ('views_count', 'views_count'),
+        ('downloads_count', 'downloads_count'),
+        ('created_at', 'created_at'),
+    ]),
+    'views': (BookShowed, [
+        ('id', 'id'),
+        ('book_id', 'book_id'),
+        ('user_id', 'user_id'),
+        ('created_at', 'created_at'),
+    ]),
+    'downloads': (BookDownloaded, [
+        ('id', 'id'),
+        ('book_id', 'book_id'),
+        ('user_id', 'user_id'),
+        ('created_at', 'created_at'),
+    ]),
+}
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+def date_range(model, since=None, until=None):
+    # Book.created_at is a datetime, so the bounds become the start of each
+    # day instead of a __date lookup that would keep the index out of play.
+    lookups = {}
+    is_datetime = model._meta.get_field('created_at').get_internal_type() == 'DateTimeField'
+    if since:
+        lookups['created_at__gte'] = start_of_day(since) if is_datetime else since
+    if until:
+        if is_datetime:
+            lookups['created_at__lt'] = start_of_day(until + datetime.timedelta(days=1))
+        else:
+            lookups['created_at__lte'] = until
+    return lookups
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def export_rows(dataset, since=None, until=None):
+    model, columns = DATASETS[dataset]
+    queryset = (model.objects.filter(**date_range(model, since, until))
+                .order_by('pk').values_list(*(field for _, field in columns)))
+    # iterator() uses a server-side cursor on PostgreSQL, so rows are fetched
+    # CHUNK_SIZE at a time instead of loading the whole table.
+    return [name for name, _ in columns], queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class LineBuffer:
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), default=str, ensure_ascii=False) + '\n'
+
+
+def encode(lines):
+    # Joins lines into chunks of about FLUSH_SIZE bytes, a write per row
+    # would dominate the response time.
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= FLUSH_SIZE:
+            yield ''.join(chunk).encode()
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk).encode()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(dataset, fmt='csv', compress=False, since=None, until=None):
+    header, rows = export_rows(dataset, since, until)
+    lines = iter_jsonl(header, rows) if fmt == 'jsonl' else iter_csv(header, rows)
+    chunks = encode(lines)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(dataset, fmt, compress=False):
+    name = f'{dataset}-{timezone.localdate().isoformat()}.{fmt}'
+    return name + '.gz' if compress else name
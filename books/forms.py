@@ -1,12 +1,72 @@
 from django import forms
-from .models import Book, OrderBook, SendBook
+from .isbn import normalize_isbn, to_isbn13
+from .models import Book, OrderBook, SendBook, Upload
+from .stored_files import release_file
 
 
-class BookForm(forms.ModelForm):
+class UploadChoiceField(forms.ModelChoiceField):
+    widget = forms.HiddenInput
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Upload.objects.filter(completed_at__isnull=False), required=False, **kwargs)
+
+
+class UploadFormMixin:
+    # The file itself arrives through the chunked upload endpoint, the form
+    # only points at the finished upload of the same user.
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        uploads = self.fields['upload'].queryset
+        if user is not None and user.is_authenticated:
+            self.fields['upload'].queryset = uploads.filter(user=user)
+        else:
+            self.fields['upload'].queryset = uploads.none()
+
+    def attach_upload(self, instance):
+        upload = self.cleaned_data.get('upload')
+        if upload is None:
+            return None
+        instance.file.name = upload.path
+        if hasattr(instance, 'size'):
+            instance.size = upload.size
+        return upload
+
+    def release_upload(self, upload):
+        # The finished upload holds a reference on its stored file until the
+        # saved instance has taken its own.
+        upload.delete()
+        release_file(upload.path)
+
+    def save(self, commit=True):
+        upload = self.attach_upload(self.instance)
+        instance = super().save(commit)
+        if upload is not None:
+            if commit:
+                self.release_upload(upload)
+            else:
+                save_m2m = self.save_m2m
+
+                def save_m2m_and_release():
+                    save_m2m()
+                    self.release_upload(upload)
+                self.save_m2m = save_m2m_and_release
+        return instance
+
+
+class BookForm(UploadFormMixin, forms.ModelForm):
+    upload = UploadChoiceField()
+
     class Meta:
         model = Book
         fields = ['title', 'description', 'author', 'year', 'pages', 'category',
-                  'isbn', 'sub_category', 'url', 'file', 'size']
+                  'isbn', 'sub_category', 'url']
+
+    def clean_isbn(self):
+        isbn = normalize_isbn(self.cleaned_data.get('isbn'))
+        isbn13 = to_isbn13(isbn)
+        if isbn13 and Book.objects.filter(isbn13=isbn13).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError('A book with this ISBN already exists.')
+        return isbn
 
 
 class OrderBookForm(forms.ModelForm):
@@ -15,9 +75,9 @@ class OrderBookForm(forms.ModelForm):
         fields = ['book_name', 'description', 'author']
 
 
-class SendBookForm(forms.ModelForm):
+class SendBookForm(UploadFormMixin, forms.ModelForm):
+    upload = UploadChoiceField()
+
     class Meta:
         model = SendBook
-        fields = ['book_name', 'description', 'author', 'file', 'url']
-
-
+        fields = ['book_name', 'description', 'author', 'url']
@@ -0,0 +1,157 @@
+import csv
+import gzip
+import json
+import sys
+
+from books.autocomplete import autocomplete_index
+from books.cache import bump_generation
+from books.isbn import normalize_isbn, to_isbn13
+from books.models import Book, Category, SubCategory
+from books.search import book_index
+
+UPDATE_FIELDS = ['title', 'description', 'author', 'year', 'pages', 'category', 'sub_category', 'url',
+                 'updated_at']
+MAX_REPORTED_ERRORS = 20
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+def open_source(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def iter_records(f, fmt):
+    # Yields (line number, record or the error that made the line unreadable).
+    if fmt == 'jsonl':
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+    else:
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+
+
+class CategoryMap:
+    # Category tables are small, so names are resolved from memory instead
+    # of one lookup per row.
+
+    def __init__(self, create=False):
+        self.create = create
+        self.categories = {name.casefold(): pk for pk, name in Category.objects.values_list('pk', 'name')}
+        self.sub_categories = {
+            (category_id, name.casefold()): pk
+            for pk, category_id, name in SubCategory.objects.values_list('pk', 'category_id', 'name')
+        }
+
+    def category_id(self, name):
+        key = name.strip().casefold()
+        if key not in self.categories:
+            if not self.create:
+                raise ValueError(f'Unknown category "{name}"')
+            self.categories[key] = Category.objects.create(name=name.strip()).pk
+        return self.categories[key]
+
+    def sub_category_id(self, category_id, name):
+        key = (category_id, name.strip().casefold())
+        if key not in self.sub_categories:
+            if not self.create:
+                raise ValueError(f'Unknown sub-category "{name}"')
+            self.sub_categories[key] = SubCategory.objects.create(category_id=category_id, name=name.strip()).pk
+        return self.sub_categories[key]
+
+
+class BookImporter:
+    def __init__(self, categories, batch_size=1000):
+        self.categories = categories
+        self.batch_size = batch_size
+        self.processed = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def build(self, record):
+        if not isinstance(record, dict):
+            raise ValueError('Expected an object per line')
+        title = (record.get('title') or '').strip()
+        if not title:
+            raise ValueError('Missing title')
+        try:
+            year = int(record.get('year'))
+            pages = int(record.get('pages') or 0)
+        except (TypeError, ValueError):
+            raise ValueError('year and pages must be integers')
+        isbn = normalize_isbn(record.get('isbn'))
+        if isbn and len(isbn) > 20:
+            raise ValueError(f'Invalid ISBN "{isbn}"')
+        category_id = self.categories.category_id(record.get('category') or '')
+        sub_category = (record.get('sub_category') or '').strip()
+        return Book(
+            title=title[:100],
+            description=record.get('description') or '',
+            author=(record.get('author') or '').strip()[:100],
+            year=year,
+            pages=pages,
+            category_id=category_id,
+            sub_category_id=self.categories.sub_category_id(category_id, sub_category) if sub_category else None,
+            url=record.get('url') or None,
+            isbn=isbn,
+            isbn13=to_isbn13(isbn),
+        )
+
+    def flush(self, batch):
+        # Rows sharing an ISBN within one statement would hit the same
+        # conflict twice, which PostgreSQL rejects; the last one wins.
+        books = list({book.isbn13 or book.isbn or id(book): book for book in batch}.values())
+        # An ISBN-10 row for a book stored under its ISBN-13 (or the other
+        # way round) takes the stored form, so it upserts that book.
+        stored = dict(Book.objects.filter(isbn13__in=[book.isbn13 for book in books if book.isbn13])
+                      .values_list('isbn13', 'isbn'))
+        for book in books:
+            if book.isbn13 in stored:
+                book.isbn = stored[book.isbn13]
+        Book.objects.bulk_create(books, update_conflicts=True, unique_fields=['isbn'],
+                                 update_fields=UPDATE_FIELDS)
+        self.imported += len(books)
+
+    def run(self, records, progress=None):
+        batch = []
+        for number, record in records:
+            self.processed += 1
+            try:
+                if isinstance(record, Exception):
+                    raise ValueError(str(record))
+                batch.append(self.build(record))
+            except ValueError as e:
+                self.skipped += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append(f'line {number}: {e}')
+                continue
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+                if progress:
+                    progress(self)
+        if batch:
+            self.flush(batch)
+            if progress:
+                progress(self)
+        if self.imported:
+            # bulk_create skips post_save, so do what the Book signals would.
+            book_index.invalidate()
+            autocomplete_index.invalidate()
+            bump_generation('books')
+        return self
@@ -0,0 +1,35 @@
+import re
+
+ISBN_NOISE_RE = re.compile(r'^ISBN(?:-1[03])?:?|[\s-]')
+
+
+def normalize_isbn(value):
+    if value is None:
+        return None
+    return ISBN_NOISE_RE.sub('', str(value).strip().upper()) or None
+
+
+ISBN10_RE = re.compile(r'^\d{9}[\dX]$')
+ISBN13_RE = re.compile(r'^97[89]\d{10}$')
+
+
+def isbn13_check_digit(digits):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits[:12]))
+    return str(-total % 10)
+
+
+def to_isbn13(value):
+    # Returns the ISBN-13 form of a valid ISBN-10 or ISBN-13, None for
+    # anything else, so callers can tell an ISBN from a fragment of one.
+    isbn = normalize_isbn(value)
+    if not isbn:
+        return None
+    if ISBN10_RE.match(isbn):
+        total = sum((10 - i) * (10 if digit == 'X' else int(digit)) for i, digit in enumerate(isbn))
+        if total % 11:
+            return None
+        isbn = '978' + isbn[:9]
+        return isbn + isbn13_check_digit(isbn)
+    if ISBN13_RE.match(isbn) and isbn[12] == isbn13_check_digit(isbn):
+        return isbn
+    return None
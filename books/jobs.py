@@ -0,0 +1,97 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from books.models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class Task:
+    def __init__(self, func, max_attempts):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__name__}'
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        if getattr(settings, 'BOOK_JOBS_EAGER', False):
+            self.func(*args, **kwargs)
+            return None
+        return Job.objects.create(name=self.name, args=list(args), kwargs=kwargs,
+                                  max_attempts=self.max_attempts, run_at=timezone.now())
+
+
+def task(func=None, max_attempts=5):
+    def register(func):
+        registered = Task(func, max_attempts)
+        registry[registered.name] = registered
+        return registered
+    if func is not None:
+        return register(func)
+    return register
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'BOOK_JOBS_RETRY_DELAY', 10)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def claim_next_job():
+    now = timezone.now()
+    # A RUNNING job that has not been touched for BOOK_JOBS_TIMEOUT belonged
+    # to a worker that died, so it is picked up again.
+    stale = now - timedelta(seconds=getattr(settings, 'BOOK_JOBS_TIMEOUT', 15 * 60))
+    with transaction.atomic():
+        job = (Job.objects.select_for_update(skip_locked=True)
+               .filter(Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, updated_at__lt=stale))
+               .order_by('run_at', 'id')
+               .first())
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+    return job
+
+
+def run_job(job):
+    registered = registry.get(job.name)
+    try:
+        if registered is None:
+            raise LookupError(f'Unknown task {job.name}')
+        registered.func(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if registered is not None and job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = Job.FAILED
+        logger.warning('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts, exc_info=True)
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+    job.save(update_fields=['status', 'run_at', 'last_error', 'updated_at'])
+    return job
+
+
+def prune_jobs(older_than, batch_size=1000):
+    # Finished jobs are only kept to look into failures, deleting them in
+    # batches keeps the queue table and the claim scan small.
+    finished = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], updated_at__lt=older_than)
+    deleted = 0
+    while True:
+        ids = list(finished.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(pk__in=ids).delete()[0]
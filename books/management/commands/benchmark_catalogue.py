@@ -0,0 +1,83 @@
+import json
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from books.benchmarks import compare_results, isolated_state, run_async_comparison, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the catalogue endpoints against a freshly seeded test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--views', type=int, default=20000)
+        parser.add_argument('--downloads', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='Only run the named endpoint (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Baseline JSON file to check the results against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative p95 slowdown before --compare fails')
+        parser.add_argument('--async-views', action='store_true',
+                            help='Compare the sync and async list/detail views under concurrent load instead')
+        parser.add_argument('--concurrency', type=int, default=10)
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, DEBUG=False), isolated_state():
+                self.stdout.write('Seeding dataset...')
+                call_command('generate_books', books=options['books'], users=options['users'],
+                             views=options['views'], downloads=options['downloads'],
+                             seed=options['seed'], stdout=StringIO())
+                if options['async_views']:
+                    results = run_async_comparison(options['iterations'], options['concurrency'])
+                else:
+                    results = run_benchmarks(options['iterations'], options['warmup'], options['endpoints'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if options['async_views']:
+            for name, result in results.items():
+                for mode in ('sync', 'async'):
+                    self.stdout.write(
+                        f"{name:<20} {mode:<6} p50 {result[mode]['p50_ms']:>8}ms  "
+                        f"p95 {result[mode]['p95_ms']:>8}ms  {result[mode]['throughput_rps']:>8} req/s"
+                    )
+            if options['output']:
+                with open(options['output'], 'w') as f:
+                    json.dump({'concurrency': options['concurrency'], 'results': results}, f, indent=2)
+            return
+
+        report = {
+            'dataset': {key: options[key] for key in ('books', 'users', 'views', 'downloads', 'seed')},
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28} p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms  "
+                f"p99 {result['p99_ms']:>8}ms  {result['throughput_rps']:>8} req/s  "
+                f"{result['queries']:>3} queries  {result['bytes']} bytes"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare_results(baseline['results'], results, options['threshold'])
+            if regressions:
+                raise CommandError('Benchmark regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from books.uploads import delete_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that were never attached to a book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Only delete uploads older than this')
+
+    def handle(self, *args, **options):
+        deleted = delete_stale_uploads(timezone.now() - timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} stale uploads'))
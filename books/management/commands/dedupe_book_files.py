@@ -0,0 +1,47 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from books.models import Book, SendBook
+from books.storage import book_storage, sha256_from_name
+from books.stored_files import acquire_file
+
+READ_SIZE = 1024 * 1024
+
+
+def hash_file(name):
+    hasher = hashlib.sha256()
+    with book_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Move existing Book/SendBook files under their content hash and merge duplicates'
+
+    def handle(self, *args, **options):
+        moved = {}
+        placed = set()
+        duplicates = 0
+        for model in (Book, SendBook):
+            rows = model.objects.exclude(file='').exclude(file__isnull=True).values_list('pk', 'file')
+            for pk, name in rows.iterator():
+                if sha256_from_name(name):
+                    continue
+                if name not in moved:
+                    if not book_storage.exists(name):
+                        self.stderr.write(f'{model.__name__} {pk}: {name} is missing, skipped')
+                        continue
+                    sha256 = hash_file(name)
+                    size = book_storage.size(name)
+                    moved[name] = book_storage.adopt(name, sha256)
+                    if moved[name] in placed:
+                        duplicates += 1
+                        self.stdout.write(f'{name} duplicates {moved[name]}, {size} bytes freed')
+                    placed.add(moved[name])
+                # Queryset updates skip the signals, so count the reference here.
+                model.objects.filter(pk=pk).update(file=moved[name])
+                acquire_file(moved[name])
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {len(moved)} files into content-addressed storage, {duplicates} duplicates removed'
+        ))
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from books.exporter import DATASETS, FORMATS, export_stream, parse_date
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalogue or the view/download history to CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output on the fly')
+        parser.add_argument('--from', dest='since', help='Only rows created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='until', help='Only rows created on or before this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_date(options['since'])
+            until = parse_date(options['until'])
+        except ValueError as e:
+            raise CommandError(e)
+        chunks = export_stream(options['dataset'], options['format'], options['gzip'], since, until)
+        if options['path'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        written = 0
+        try:
+            with open(options['path'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+        except OSError as e:
+            raise CommandError(e)
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {options["path"]}'))
@@ -1,35 +1,153 @@
+import itertools
 import random
+from multiprocessing import Pool
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from faker import Faker
-from books.models import Category, SubCategory, Book
+from books.autocomplete import autocomplete_index
+from books.cache import bump_generation
+from books.isbn import normalize_isbn, to_isbn13
+from books.models import Category, SubCategory, Book, BookShowed, BookDownloaded
+from books.search import book_index
+
+CustomUser = get_user_model()
+
+
+def generate_book_rows(args):
+    # Runs in worker processes: seeding per batch keeps the output identical
+    # whatever the number of workers.
+    batch_index, size, seed, category_ids, sub_categories = args
+    fake = Faker()
+    fake.seed_instance(seed + batch_index)
+    rnd = random.Random(seed + batch_index)
+    rows = []
+    for _ in range(size):
+        category_id, sub_category_id = rnd.choice(sub_categories) if sub_categories else (rnd.choice(category_ids), None)
+        isbn = normalize_isbn(fake.isbn13())
+        rows.append({
+            'title': fake.sentence(nb_words=4)[:100],
+            'description': fake.text(),
+            'author': fake.name()[:100],
+            'year': int(fake.year()),
+            'pages': rnd.randint(100, 1000),
+            'category_id': category_id,
+            'sub_category_id': sub_category_id,
+            'url': fake.url(),
+            'size': rnd.randint(1, 1000),
+            'isbn': isbn,
+            'isbn13': to_isbn13(isbn),
+        })
+    return rows
+
+
+def zipf_weights(count, exponent):
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
 
 
 class Command(BaseCommand):
-    help = 'Generate 100 random books'
+    help = 'Generate random books, users and view/download events for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100)
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--views', type=int, default=0)
+        parser.add_argument('--downloads', type=int, default=0)
+        parser.add_argument('--categories', type=int, default=10,
+                            help='Categories to create when the database has none')
+        parser.add_argument('--sub-categories', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes used for Faker generation')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Exponent of the Zipf-like popularity distribution')
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.seed = options['seed']
+        self.rnd = random.Random(self.seed)
         fake = Faker()
+        fake.seed_instance(self.seed)
+
+        if options['books']:
+            category_ids, sub_categories = self.ensure_categories(fake, options['categories'], options['sub_categories'])
+            self.create_books(options['books'], options['workers'], category_ids, sub_categories)
+            # bulk_create skips post_save, so do what the Book signals would.
+            book_index.invalidate()
+            autocomplete_index.invalidate()
+            bump_generation('books')
+        if options['users']:
+            self.create_users(options['users'])
+
+        if options['views'] or options['downloads']:
+            book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+            user_ids = list(CustomUser.objects.order_by('id').values_list('id', flat=True))
+            if not book_ids or not user_ids:
+                self.stderr.write('Views and downloads need at least one book and one user')
+            else:
+                # Popularity rank is shuffled so it does not follow insertion order.
+                self.rnd.shuffle(book_ids)
+                weights = zipf_weights(len(book_ids), options['zipf'])
+                self.create_events(BookShowed, options['views'], book_ids, user_ids, weights)
+                self.create_events(BookDownloaded, options['downloads'], book_ids, user_ids, weights)
+                call_command('rebuild_book_counters', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS('Successfully generated load test data'))
+
+    def ensure_categories(self, fake, category_count, sub_category_count):
+        if not Category.objects.exists():
+            Category.objects.bulk_create([Category(name=fake.word()) for _ in range(category_count)])
+            bump_generation('categories')
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        if not SubCategory.objects.exists():
+            SubCategory.objects.bulk_create([
+                SubCategory(category_id=self.rnd.choice(category_ids), name=fake.word())
+                for _ in range(sub_category_count)
+            ])
+            bump_generation('categories')
+        return category_ids, list(SubCategory.objects.values_list('category_id', 'id'))
+
+    def create_books(self, total, workers, category_ids, sub_categories):
+        batches = [
+            (index, min(self.batch_size, total - start), self.seed, category_ids, sub_categories)
+            for index, start in enumerate(range(0, total, self.batch_size))
+        ]
+        created = 0
+        if workers > 1:
+            with Pool(workers) as pool:
+                for rows in pool.imap(generate_book_rows, batches):
+                    created += self.insert_books(rows)
+                    self.stdout.write(f'Books: {created}/{total}')
+        else:
+            for batch in batches:
+                created += self.insert_books(generate_book_rows(batch))
+                self.stdout.write(f'Books: {created}/{total}')
+
+    def insert_books(self, rows):
+        # A rerun with the same seed yields the same ISBNs, those rows are skipped.
+        Book.objects.bulk_create([Book(**row) for row in rows], batch_size=self.batch_size, ignore_conflicts=True)
+        return len(rows)
+
+    def create_users(self, total):
+        password = make_password('testpassword123')
+        start = CustomUser.objects.count()
+        for offset in range(0, total, self.batch_size):
+            numbers = range(start + offset, start + min(offset + self.batch_size, total))
+            CustomUser.objects.bulk_create([
+                CustomUser(username=f'load_{self.seed}_{n}', email=f'load_{self.seed}_{n}@example.com',
+                           first_name='Load', last_name=f'User {n}', password=password)
+                for n in numbers
+            ], ignore_conflicts=True)
+            self.stdout.write(f'Users: {min(offset + self.batch_size, total)}/{total}')
 
-        # Create Categories and SubCategories
-        categories = Category.objects.all()
-        subcategories = [SubCategory.objects.create(category=random.choice(categories), name=fake.word()) for _ in range(30)]
-
-        # Create 100 books
-        for _ in range(100):
-            category = random.choice(categories)
-            sub_category = random.choice(subcategories)
-            Book.objects.create(
-                title=fake.sentence(nb_words=4),
-                description=fake.text(),
-                author=fake.name(),
-                year=fake.year(),
-                pages=random.randint(100, 1000),
-                category=category,
-                sub_category=sub_category,
-                url=fake.url(),
-                file=None,  # Assuming you handle file uploads separately
-                size=random.randint(1, 1000),
-                isbn=fake.isbn13()
-            )
-
-        self.stdout.write(self.style.SUCCESS('Successfully generated 100 books'))
+    def create_events(self, model, total, book_ids, user_ids, weights):
+        for offset in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - offset)
+            books = self.rnd.choices(book_ids, cum_weights=weights, k=size)
+            model.objects.bulk_create([
+                model(book_id=book_id, user_id=self.rnd.choice(user_ids)) for book_id in books
+            ], ignore_conflicts=True)
+            self.stdout.write(f'{model.__name__}: {offset + size}/{total}')
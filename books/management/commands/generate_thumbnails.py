@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from books.models import Book
+from books.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Create cover thumbnails for existing Book images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate thumbnails that already exist')
+
+    def handle(self, *args, **options):
+        storage = Book._meta.get_field('image').storage
+        names = (Book.objects.exclude(image='').exclude(image__isnull=True)
+                 .order_by('image').values_list('image', flat=True).distinct())
+        processed = created = 0
+        for name in names.iterator(chunk_size=500):
+            created += len(generate_thumbnails(name, storage, force=options['force']))
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images, wrote {created} thumbnails'))
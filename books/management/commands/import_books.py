@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from books.importer import BookImporter, CategoryMap, detect_format, iter_records, open_source
+
+
+class Command(BaseCommand):
+    help = 'Stream books from a CSV or JSON Lines file and upsert them by ISBN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/JSONL file, optionally gzipped, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format, guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create unknown categories and sub-categories instead of skipping the row')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        started = time.monotonic()
+
+        def progress(importer):
+            rate = importer.processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{importer.processed} rows read, {importer.imported} imported, '
+                              f'{importer.skipped} skipped ({rate:.0f} rows/s)')
+
+        try:
+            source = open_source(options['path'])
+        except OSError as e:
+            raise CommandError(e)
+        importer = BookImporter(CategoryMap(create=options['create_categories']), options['batch_size'])
+        with source:
+            importer.run(iter_records(source, fmt), progress if options['verbosity'] else None)
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        if importer.skipped > len(importer.errors):
+            self.stderr.write(f'... and {importer.skipped - len(importer.errors)} more skipped rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} books, skipped {importer.skipped} of {importer.processed} rows'
+        ))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from books.jobs import prune_jobs
+
+
+class Command(BaseCommand):
+    help = 'Delete done and failed background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Only delete jobs finished before this many days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = prune_jobs(timezone.now() - timedelta(days=options['days']), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished jobs'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from books.autocomplete import autocomplete_index
+from books.cache import bump_generation
+from books.models import Book, BookShowed, BookDownloaded, event_count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Book.views_count and Book.downloads_count from the event tables'
+
+    def handle(self, *args, **kwargs):
+        updated = Book.objects.update(
+            views_count=event_count_subquery(BookShowed),
+            downloads_count=event_count_subquery(BookDownloaded),
+        )
+        # A queryset update skips the signals; completions are ranked by views.
+        bump_generation('counters')
+        autocomplete_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt counters for {updated} books'))
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from books.stats import rollup_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Roll BookShowed/BookDownloaded events up into BookDailyStats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Recompute days from this date (YYYY-MM-DD)')
+        parser.add_argument('--full', action='store_true', help='Rebuild the whole rollup')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+        elif options['full']:
+            since = date.min
+        since, rows = rollup_daily_stats(since)
+        start = 'the beginning' if since in (None, date.min) else since
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rows} book-days from {start}'))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books import tasks  # noqa: F401  registers the tasks
+from books.jobs import claim_next_job, run_job
+from books.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Exit after running this many jobs')
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while not options['max_jobs'] or processed < options['max_jobs']:
+                job = claim_next_job()
+                if job is None:
+                    if options['burst']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                job = run_job(job)
+                processed += 1
+                if job.status == Job.DONE:
+                    self.stdout.write(f'Job {job.pk} {job.name} done')
+                else:
+                    self.stderr.write(f'Job {job.pk} {job.name} {job.status} after {job.attempts} attempts')
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
@@ -0,0 +1,223 @@
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+
+logger = logging.getLogger('books.performance')
+
+WORST_REQUESTS_KEY = 'books:performance:worst:{}'
+WORST_FLOOR_TTL = 60
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = []
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.statements.append((duration, sql))
+        self.statements.sort(key=lambda statement: statement[0], reverse=True)
+        del self.statements[getattr(settings, 'PERFORMANCE_SLOWEST_STATEMENTS', 5):]
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self, request, response):
+        match = request.resolver_match
+        return {
+            'url_name': match.view_name if match else None,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(self.total_time * 1000, 2),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'slowest': [{'ms': round(duration * 1000, 2), 'sql': sql} for duration, sql in self.statements],
+            'at': time.time(),
+        }
+
+
+def query_recorder(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if metrics is not None:
+            metrics.record_query(sql, time.perf_counter() - started)
+
+
+def add_query_recorder(connection, **kwargs):
+    if query_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_recorder)
+
+
+def instrument_connections():
+    # The recorder stays on every connection, including the ones the async
+    # ORM opens in its worker thread; requests are told apart by the
+    # current_metrics context variable, which sync_to_async carries over.
+    connection_created.connect(add_query_recorder, dispatch_uid='books.performance')
+    for connection in connections.all(initialized_only=True):
+        add_query_recorder(connection)
+
+
+def instrument_templates():
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original_render = Template.render
+
+    def render(self, context):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return original_render(self, context)
+        # Included templates call render() again; only time the outermost one.
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context)
+        finally:
+            metrics.template_depth -= 1
+            if metrics.template_depth == 0:
+                metrics.template_time += time.perf_counter() - started
+
+    render.instrumented = True
+    Template.render = render
+
+
+def instrument_cache_backend(backend_class):
+    if getattr(backend_class.get, 'instrumented', False):
+        return
+    original_get = backend_class.get
+    original_get_many = backend_class.get_many
+    missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = original_get(self, key, missing, version)
+        metrics = current_metrics.get()
+        if metrics is not None:
+            if value is missing:
+                metrics.cache_misses += 1
+            else:
+                metrics.cache_hits += 1
+        return default if value is missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = original_get_many(self, keys, version)
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.cache_hits += len(values)
+            metrics.cache_misses += len(keys) - len(values)
+        return values
+
+    get.instrumented = True
+    backend_class.get = get
+    backend_class.get_many = get_many
+
+
+# Per process: url name -> (fastest time on the full shared list, when it was
+# read). Requests under it cannot make the list, so they skip the cache.
+worst_floors = {}
+
+
+def record_worst_request(data):
+    limit = getattr(settings, 'PERFORMANCE_WORST_REQUESTS', 20)
+    floor, read_at = worst_floors.get(data['url_name'], (0, 0))
+    if data['total_ms'] <= floor and time.monotonic() - read_at < WORST_FLOOR_TTL:
+        return
+    key = WORST_REQUESTS_KEY.format(data['url_name'])
+    worst = cache.get(key) or []
+    if len(worst) < limit or data['total_ms'] > worst[-1]['total_ms']:
+        worst.append(data)
+        worst.sort(key=lambda item: item['total_ms'], reverse=True)
+        worst = worst[:limit]
+        cache.set(key, worst, None)
+    if len(worst) >= limit:
+        worst_floors[data['url_name']] = (worst[-1]['total_ms'], time.monotonic())
+
+
+def get_worst_requests(url_names):
+    keys = {WORST_REQUESTS_KEY.format(name): name for name in url_names}
+    found = cache.get_many(keys)
+    return {name: found.get(key, []) for key, name in keys.items()}
+
+
+def server_timing(metrics, total):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'tpl;dur={metrics.template_time * 1000:.1f}',
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instrument_connections()
+        instrument_templates()
+        for alias in settings.CACHES:
+            instrument_cache_backend(type(caches[alias]))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        data = self.finish(request, response, metrics)
+        if data is not None:
+            record_worst_request(data)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        data = self.finish(request, response, metrics)
+        if data is not None:
+            await sync_to_async(record_worst_request)(data)
+        return response
+
+    def finish(self, request, response, metrics):
+        # Returns the data to record as a worst request, if it may be one.
+        total = metrics.total_time
+        response['Server-Timing'] = server_timing(metrics, total)
+        data = metrics.as_dict(request, response)
+        if random.random() < getattr(settings, 'PERFORMANCE_LOG_SAMPLE_RATE', 0.01):
+            logger.info(json.dumps(data))
+        if request.resolver_match and request.resolver_match.namespace == 'books':
+            return data
+        return None
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    BookShowed = apps.get_model('books', 'BookShowed')
+    BookDownloaded = apps.get_model('books', 'BookDownloaded')
+
+    def count_subquery(model):
+        counts = (model.objects.filter(book_id=OuterRef('pk'))
+                  .order_by().values('book_id').annotate(total=Count('id')).values('total'))
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Book.objects.update(
+        views_count=count_subquery(BookShowed),
+        downloads_count=count_subquery(BookDownloaded),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_sendbook_orderbook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='downloads_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
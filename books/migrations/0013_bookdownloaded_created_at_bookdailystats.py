@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookdownloaded',
+            name='created_at',
+            field=models.DateField(auto_now_add=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='BookDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('downloads', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='books.book')),
+            ],
+            options={
+                'unique_together': {('book', 'day')},
+                'indexes': [models.Index(fields=['day', 'book'], name='book_daily_stats_day_idx')],
+            },
+        ),
+    ]
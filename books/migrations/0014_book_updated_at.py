@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_updated_at(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Book.objects.filter(updated_at__isnull=True).update(updated_at=Coalesce('created_at', Now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_bookdownloaded_created_at_bookdailystats'),
+    ]
+
+    operations = [
+        # The column is added without auto_now so SQLite can use ALTER TABLE
+        # instead of rebuilding books_book, which would recreate the
+        # PostgreSQL-only search indexes.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AddField(
+                    model_name='book',
+                    name='updated_at',
+                    field=models.DateTimeField(null=True),
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='book',
+                    name='updated_at',
+                    field=models.DateTimeField(auto_now=True, null=True, blank=True),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
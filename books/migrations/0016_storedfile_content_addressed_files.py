@@ -0,0 +1,39 @@
+import books.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # The storage only lives in Python, so SQLite does not need to
+        # rebuild books_book (and trip over the PostgreSQL-only indexes).
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='book',
+                    name='file',
+                    field=models.FileField(blank=True, null=True, storage=books.storage.ContentAddressedStorage(), upload_to='books/'),
+                ),
+                migrations.AlterField(
+                    model_name='sendbook',
+                    name='file',
+                    field=models.FileField(blank=True, null=True, storage=books.storage.ContentAddressedStorage(), upload_to='books/'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,90 @@
+import re
+
+from django.db import migrations, models
+
+MAX_REPORTED_DUPLICATES = 50
+
+# Frozen copy of books.isbn.normalize_isbn, so later changes to the app code
+# do not change what this migration does.
+ISBN_NOISE_RE = re.compile(r'^ISBN(?:-1[03])?:?|[\s-]')
+
+
+def normalize_isbn(value):
+    if value is None:
+        return None
+    return ISBN_NOISE_RE.sub('', str(value).strip().upper()) or None
+
+
+def find_duplicate_isbns(Book):
+    books = {}
+    for pk, isbn in Book.objects.exclude(isbn=None).values_list('pk', 'isbn').order_by('pk').iterator(chunk_size=2000):
+        isbn = normalize_isbn(isbn)
+        if isbn is not None:
+            books.setdefault(isbn, []).append(pk)
+    return {isbn: pks for isbn, pks in books.items() if len(pks) > 1}
+
+
+def normalize_isbns(apps, schema_editor):
+    # Books that share an ISBN once it is normalized have to be merged or
+    # corrected by hand, the unique constraint below would reject them.
+    Book = apps.get_model('books', 'Book')
+    duplicates = find_duplicate_isbns(Book)
+    if duplicates:
+        report = '\n'.join(f'  {isbn}: books {", ".join(map(str, pks))}'
+                           for isbn, pks in list(duplicates.items())[:MAX_REPORTED_DUPLICATES])
+        if len(duplicates) > MAX_REPORTED_DUPLICATES:
+            report += f'\n  ... and {len(duplicates) - MAX_REPORTED_DUPLICATES} more'
+        raise RuntimeError(f'{len(duplicates)} ISBNs are shared by several books, '
+                           f'fix them before migrating:\n{report}')
+    changed = []
+    for book in Book.objects.exclude(isbn=None).only('pk', 'isbn').order_by('pk').iterator(chunk_size=2000):
+        isbn = normalize_isbn(book.isbn)
+        if isbn != book.isbn:
+            book.isbn = isbn
+            changed.append(book)
+        if len(changed) >= 2000:
+            Book.objects.bulk_update(changed, ['isbn'])
+            changed = []
+    Book.objects.bulk_update(changed, ['isbn'])
+
+
+class AddUniqueConstraint(migrations.AddConstraint):
+    # SQLite rebuilds the whole table to add a constraint, which would also
+    # try to create the PostgreSQL-only GIN indexes. A unique index enforces
+    # the same rule there and is a valid ON CONFLICT target.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'sqlite':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        columns = ', '.join(schema_editor.quote_name(model._meta.get_field(name).column)
+                            for name in self.constraint.fields)
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX {schema_editor.quote_name(self.constraint.name)} '
+            f'ON {schema_editor.quote_name(model._meta.db_table)} ({columns})'
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'sqlite':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        schema_editor.execute(f'DROP INDEX {schema_editor.quote_name(self.constraint.name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_storedfile_content_addressed_files'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+        AddUniqueConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=['isbn'], name='book_isbn_unique'),
+        ),
+        # The unique index serves ISBN lookups as well.
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_isbn_idx',
+        ),
+    ]
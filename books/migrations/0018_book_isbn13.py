@@ -0,0 +1,93 @@
+import re
+
+from django.db import migrations, models
+
+MAX_REPORTED_DUPLICATES = 50
+
+# Frozen copies of books.isbn.normalize_isbn and to_isbn13, so later changes
+# to the app code do not change what this migration does.
+ISBN_NOISE_RE = re.compile(r'^ISBN(?:-1[03])?:?|[\s-]')
+ISBN10_RE = re.compile(r'^\d{9}[\dX]$')
+ISBN13_RE = re.compile(r'^97[89]\d{10}$')
+
+
+def normalize_isbn(value):
+    if value is None:
+        return None
+    return ISBN_NOISE_RE.sub('', str(value).strip().upper()) or None
+
+
+def isbn13_check_digit(digits):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits[:12]))
+    return str(-total % 10)
+
+
+def to_isbn13(value):
+    isbn = normalize_isbn(value)
+    if not isbn:
+        return None
+    if ISBN10_RE.match(isbn):
+        total = sum((10 - i) * (10 if digit == 'X' else int(digit)) for i, digit in enumerate(isbn))
+        if total % 11:
+            return None
+        isbn = '978' + isbn[:9]
+        return isbn + isbn13_check_digit(isbn)
+    if ISBN13_RE.match(isbn) and isbn[12] == isbn13_check_digit(isbn):
+        return isbn
+    return None
+
+
+def find_duplicate_isbn13s(Book):
+    books = {}
+    for pk, isbn in Book.objects.exclude(isbn=None).values_list('pk', 'isbn').order_by('pk').iterator(chunk_size=2000):
+        isbn13 = to_isbn13(isbn)
+        if isbn13 is not None:
+            books.setdefault(isbn13, []).append(pk)
+    return {isbn13: pks for isbn13, pks in books.items() if len(pks) > 1}
+
+
+def backfill_isbn13(apps, schema_editor):
+    # An ISBN-10 and an ISBN-13 of the same edition share an isbn13, such
+    # books have to be merged or corrected by hand, like in 0017.
+    Book = apps.get_model('books', 'Book')
+    duplicates = find_duplicate_isbn13s(Book)
+    if duplicates:
+        report = '\n'.join(f'  {isbn13}: books {", ".join(map(str, pks))}'
+                           for isbn13, pks in list(duplicates.items())[:MAX_REPORTED_DUPLICATES])
+        if len(duplicates) > MAX_REPORTED_DUPLICATES:
+            report += f'\n  ... and {len(duplicates) - MAX_REPORTED_DUPLICATES} more'
+        raise RuntimeError(f'{len(duplicates)} editions are listed under several books, '
+                           f'fix them before migrating:\n{report}')
+    changed = []
+    for book in Book.objects.exclude(isbn=None).only('pk', 'isbn').order_by('pk').iterator(chunk_size=2000):
+        isbn13 = to_isbn13(book.isbn)
+        if isbn13 is None:
+            continue
+        book.isbn13 = isbn13
+        changed.append(book)
+        if len(changed) >= 2000:
+            Book.objects.bulk_update(changed, ['isbn13'])
+            changed = []
+    Book.objects.bulk_update(changed, ['isbn13'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_normalize_book_isbn'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True),
+        ),
+        migrations.RunPython(backfill_isbn13, migrations.RunPython.noop),
+        # A partial index keeps the rows without an ISBN out of it.
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(condition=models.Q(('isbn13__isnull', False)), fields=('isbn13',),
+                                               name='book_isbn13_unique'),
+        ),
+    ]
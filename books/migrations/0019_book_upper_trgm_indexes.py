@@ -0,0 +1,54 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+class PostgresAddIndex(migrations.AddIndex):
+    # See 0009: GIN indexes only exist on PostgreSQL.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class PostgresRemoveIndex(migrations.RemoveIndex):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_book_isbn13'),
+    ]
+
+    operations = [
+        # icontains filters on UPPER(column), which the raw title index
+        # never served.
+        PostgresRemoveIndex(
+            model_name='book',
+            name='book_title_trgm_idx',
+        ),
+        PostgresAddIndex(
+            model_name='book',
+            index=GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='book_title_upper_trgm_idx'),
+        ),
+        PostgresAddIndex(
+            model_name='book',
+            index=GinIndex(OpClass(Upper('author'), name='gin_trgm_ops'), name='book_author_upper_trgm_idx'),
+        ),
+        PostgresAddIndex(
+            model_name='book',
+            index=GinIndex(OpClass(Upper('isbn'), name='gin_trgm_ops'), name='book_isbn_upper_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_book_upper_trgm_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookshowed',
+            index=models.Index(fields=['created_at', 'book'], name='book_showed_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookdownloaded',
+            index=models.Index(fields=['created_at', 'book'], name='book_downloaded_created_idx'),
+        ),
+    ]
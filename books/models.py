@@ -1,5 +1,16 @@
-from django.db import models
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Upper
 from accounts.models import CustomUser
+from books.cache import bump_generation
+from books.storage import book_storage
+
+
+BOOK_SEARCH_VECTOR = SearchVector('title', 'author', 'isbn', config='simple')
 
 class Category(models.Model):
 	name = models.CharField(max_length=100)
@@ -25,34 +36,135 @@ class Book(models.Model):
 	category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='books')
 	sub_category = models.ForeignKey(SubCategory, on_delete=models.SET_NULL, null=True, blank=True)
 	url = models.URLField(null=True, blank=True)
-	file = models.FileField(upload_to='books/', null=True, blank=True)
+	file = models.FileField(upload_to='books/', storage=book_storage, null=True, blank=True)
 	size = models.IntegerField(null=True, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 	isbn = models.CharField(max_length=20, null=True, blank=True)
+	isbn13 = models.CharField(max_length=13, null=True, blank=True, editable=False)
 	image = models.ImageField(upload_to='books/', null=True, blank=True, default='cover-photo.png')
+	views_count = models.PositiveIntegerField(default=0, editable=False)
+	downloads_count = models.PositiveIntegerField(default=0, editable=False)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['-views_count', '-id'], name='book_popularity_idx'),
+			models.Index(fields=['-created_at', '-id'], name='book_created_idx'),
+			models.Index(fields=['-year', '-id'], name='book_year_idx'),
+			models.Index(fields=['title', 'id'], name='book_title_idx'),
+			models.Index(fields=['category', '-views_count', '-id'], name='book_category_popularity_idx'),
+			models.Index(fields=['category', '-created_at', '-id'], name='book_category_created_idx'),
+			models.Index(fields=['category', '-year', '-id'], name='book_category_year_idx'),
+			models.Index(fields=['category', 'title', 'id'], name='book_category_title_idx'),
+			models.Index(fields=['sub_category', '-views_count', '-id'], name='book_subcat_popularity_idx'),
+			models.Index(fields=['sub_category', '-created_at', '-id'], name='book_subcat_created_idx'),
+			models.Index(fields=['sub_category', '-year', '-id'], name='book_subcat_year_idx'),
+			models.Index(fields=['sub_category', 'title', 'id'], name='book_subcat_title_idx'),
+			GinIndex(BOOK_SEARCH_VECTOR, name='book_search_vector_idx'),
+			# icontains compiles to UPPER(col::text) LIKE UPPER(...), so the
+			# substring filters need trigram indexes on the same expression.
+			GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='book_title_upper_trgm_idx'),
+			GinIndex(OpClass(Upper('author'), name='gin_trgm_ops'), name='book_author_upper_trgm_idx'),
+			GinIndex(OpClass(Upper('isbn'), name='gin_trgm_ops'), name='book_isbn_upper_trgm_idx'),
+			# Serves author__trigram_similar.
+			GinIndex(fields=['author'], name='book_author_trgm_idx', opclasses=['gin_trgm_ops']),
+		]
+		constraints = [
+			# isbn is stored normalized (see books.isbn), this is the upsert key of import_books.
+			models.UniqueConstraint(fields=['isbn'], name='book_isbn_unique'),
+			# isbn13 is derived from isbn (see books.isbn.to_isbn13) and is what
+			# ISBN searches match exactly.
+			models.UniqueConstraint(fields=['isbn13'], condition=models.Q(isbn13__isnull=False),
+									name='book_isbn13_unique'),
+		]
 
 	def __str__(self):
 		return self.title
 
 
-class BookShowed(models.Model):
+def event_count_subquery(model):
+	counts = (model.objects.filter(book_id=OuterRef('pk'))
+			  .order_by().values('book_id').annotate(total=models.Count('id')).values('total'))
+	return Coalesce(Subquery(counts, output_field=models.IntegerField()), Value(0))
+
+
+def recount_book_counters(model, book_ids):
+	if book_ids:
+		Book.objects.filter(pk__in=book_ids).update(**{model.counter_field: event_count_subquery(model)})
+		bump_generation('counters')
+
+
+class BookEventQuerySet(models.QuerySet):
+	# Counters are recounted here, once per delete, instead of in post_delete
+	# receivers: those would turn off fast deletes for the Book and user
+	# cascades and cost an UPDATE per event row.
+
+	def delete(self):
+		with transaction.atomic(using=self.db):
+			book_ids = set(self.order_by().values_list('book_id', flat=True).distinct())
+			result = super().delete()
+			recount_book_counters(self.model, book_ids)
+		return result
+
+
+class BookEvent(models.Model):
+	objects = BookEventQuerySet.as_manager()
+
+	class Meta:
+		abstract = True
+
+	def delete(self, using=None, keep_parents=False):
+		return type(self).objects.using(using or self._state.db).filter(pk=self.pk).delete()
+
+
+class BookShowed(BookEvent):
 	book = models.ForeignKey(Book, on_delete=models.CASCADE)
 	user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 	created_at = models.DateField(auto_now_add=True, null=True, blank=True)
 
+	counter_field = 'views_count'
+
 	def __str__(self):
 		return f'{self.book}'
 
+	class Meta:
+		indexes = [
+			# Daily rollups (books.stats) read one day range grouped by book.
+			models.Index(fields=['created_at', 'book'], name='book_showed_created_idx'),
+		]
 
-class BookDownloaded(models.Model):
+
+class BookDownloaded(BookEvent):
 	book = models.ForeignKey(Book, on_delete=models.CASCADE)
 	user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+	created_at = models.DateField(auto_now_add=True, null=True, blank=True)
+
+	counter_field = 'downloads_count'
 
 	def __str__(self):
 		return f'{self.book}'
 
 	class Meta:
 		unique_together = ('book', 'user')
+		indexes = [
+			models.Index(fields=['created_at', 'book'], name='book_downloaded_created_idx'),
+		]
+
+
+class BookDailyStats(models.Model):
+	book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats')
+	day = models.DateField()
+	views = models.PositiveIntegerField(default=0)
+	downloads = models.PositiveIntegerField(default=0)
+
+	def __str__(self):
+		return f'{self.book_id} {self.day}'
+
+	class Meta:
+		unique_together = ('book', 'day')
+		indexes = [
+			models.Index(fields=['day', 'book'], name='book_daily_stats_day_idx'),
+		]
 
 
 class OrderBook(models.Model):
@@ -72,10 +184,71 @@ class SendBook(models.Model):
 	book_name = models.CharField(max_length=100)
 	description = models.TextField()
 	author = models.CharField(max_length=100)
-	file = models.FileField(upload_to='books/', null=True, blank=True)
+	file = models.FileField(upload_to='books/', storage=book_storage, null=True, blank=True)
 	url = models.URLField(null=True, blank=True)
 	status = models.BooleanField(default=False)
 	created_at = models.DateField(auto_now_add=True, null=True, blank=True)
 
 	def __str__(self):
 		return f'{self.book_name}'
+
+
+class StoredFile(models.Model):
+	name = models.CharField(max_length=255, unique=True)
+	sha256 = models.CharField(max_length=64, db_index=True)
+	size = models.BigIntegerField()
+	ref_count = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return self.name
+
+
+class Upload(models.Model):
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
+	filename = models.CharField(max_length=255)
+	path = models.CharField(max_length=255)
+	size = models.BigIntegerField()
+	offset = models.BigIntegerField(default=0)
+	sha256 = models.CharField(max_length=64, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	completed_at = models.DateTimeField(null=True, blank=True)
+
+	def __str__(self):
+		return self.filename
+
+	@property
+	def is_complete(self):
+		return self.completed_at is not None
+
+
+class Job(models.Model):
+	QUEUED = 'queued'
+	RUNNING = 'running'
+	DONE = 'done'
+	FAILED = 'failed'
+	STATUSES = (
+		(QUEUED, 'Queued'),
+		(RUNNING, 'Running'),
+		(DONE, 'Done'),
+		(FAILED, 'Failed'),
+	)
+	name = models.CharField(max_length=200)
+	args = models.JSONField(default=list, blank=True)
+	kwargs = models.JSONField(default=dict, blank=True)
+	status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+	attempts = models.PositiveIntegerField(default=0)
+	max_attempts = models.PositiveIntegerField(default=5)
+	run_at = models.DateTimeField()
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.name} ({self.status})'
@@ -0,0 +1,156 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorPage(Sequence):
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor('n', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor('p', self.object_list[0])
+
+
+class CursorPaginator:
+    def __init__(self, object_list, per_page, ordering=('-views_count', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    @property
+    def fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def page(self, cursor=None):
+        if not cursor:
+            return self.first_page()
+        if cursor == 'last':
+            return self.last_page()
+        direction, values = self.decode_cursor(cursor)
+        page = self._fetch(values, forward=direction == 'n')
+        if not page:
+            raise EmptyPage('That page contains no results')
+        return page
+
+    def first_page(self):
+        return self._fetch(None, forward=True)
+
+    def last_page(self):
+        return self._fetch(None, forward=False)
+
+    def encode_cursor(self, direction, obj):
+        if isinstance(obj, dict):
+            values = [obj[name] for name in self.fields]
+        else:
+            values = [getattr(obj, name) for name in self.fields]
+        payload = json.dumps([direction, values], cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(payload)
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise PageNotAnInteger('That cursor is not valid')
+        if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(self.fields):
+            raise PageNotAnInteger('That cursor is not valid')
+        try:
+            return direction, [self._to_python(name, value) for name, value in zip(self.fields, values)]
+        except ValidationError:
+            raise PageNotAnInteger('That cursor is not valid')
+
+    def _to_python(self, name, value):
+        try:
+            field = self.object_list.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def _keyset(self, values, forward):
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            descending = name.startswith('-')
+            field = name.lstrip('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def _queryset(self, values, forward):
+        if forward:
+            ordering = self.ordering
+        else:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._keyset(values, forward))
+        return queryset[:self.per_page + 1]
+
+    def _page(self, rows, values, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if forward:
+            return CursorPage(rows, self, has_next=has_more, has_previous=values is not None)
+        rows.reverse()
+        return CursorPage(rows, self, has_next=values is not None, has_previous=has_more)
+
+    def _fetch(self, values, forward):
+        return self._page(list(self._queryset(values, forward)), values, forward)
+
+    async def _afetch(self, values, forward):
+        rows = [obj async for obj in self._queryset(values, forward)]
+        return self._page(rows, values, forward)
+
+    async def apage(self, cursor=None):
+        if not cursor:
+            return await self.afirst_page()
+        if cursor == 'last':
+            return await self.alast_page()
+        direction, values = self.decode_cursor(cursor)
+        page = await self._afetch(values, forward=direction == 'n')
+        if not page:
+            raise EmptyPage('That page contains no results')
+        return page
+
+    async def afirst_page(self):
+        return await self._afetch(None, forward=True)
+
+    async def alast_page(self):
+        return await self._afetch(None, forward=False)
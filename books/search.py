@@ -0,0 +1,112 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+
+from books.models import Book, BOOK_SEARCH_VECTOR
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class PostgresSearchBackend:
+    trigram_threshold = 0.3
+
+    def filter(self, queryset, field, value):
+        # icontains is served by the GIN trigram indexes on UPPER(title/author/isbn),
+        # trigram_similar by the one on the raw author column.
+        condition = Q(**{f'{field}__icontains': value})
+        if field == 'author':
+            condition |= Q(author__trigram_similar=value)
+        return queryset.filter(condition)
+
+    def search(self, queryset, q):
+        query = SearchQuery(q, config='simple', search_type='websearch')
+        return (queryset
+                # ts_rank returns real; cast so cursor values round-trip exactly.
+                .annotate(search=BOOK_SEARCH_VECTOR, rank=Cast(SearchRank(BOOK_SEARCH_VECTOR, query), FloatField()))
+                .filter(Q(search=query) | Q(author__trigram_similar=q))
+                .order_by('-rank', '-views_count'))
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._vocabulary = []
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+            self._vocabulary = []
+
+    def _build(self):
+        postings = defaultdict(lambda: defaultdict(int))
+        rows = Book.objects.values_list('pk', 'title', 'author', 'isbn').iterator(chunk_size=2000)
+        for pk, *fields in rows:
+            for field in fields:
+                for token in tokenize(field):
+                    postings[token][pk] += 1
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+
+    def _prefix_matches(self, token):
+        start = bisect.bisect_left(self._vocabulary, token)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            yield term
+
+    def search(self, q):
+        tokens = tokenize(q)
+        if not tokens:
+            return {}
+        with self._lock:
+            if self._postings is None:
+                self._build()
+            scores = None
+            for token in tokens:
+                token_scores = defaultdict(int)
+                for term in self._prefix_matches(token):
+                    for pk, tf in self._postings[term].items():
+                        token_scores[pk] += tf
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {pk: score + token_scores[pk] for pk, score in scores.items() if pk in token_scores}
+                if not scores:
+                    return {}
+            return dict(scores)
+
+
+class PythonSearchBackend:
+    def __init__(self, index):
+        self.index = index
+
+    def filter(self, queryset, field, value):
+        return queryset.filter(**{f'{field}__icontains': value})
+
+    def search(self, queryset, q):
+        scores = self.index.search(q)
+        if not scores:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+        rank = Case(*[When(pk=pk, then=Value(float(score))) for pk, score in scores.items()],
+                    default=Value(0.0), output_field=FloatField())
+        return queryset.filter(pk__in=scores).annotate(rank=rank).order_by('-rank', '-views_count')
+
+
+book_index = InvertedIndex()
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return PythonSearchBackend(book_index)
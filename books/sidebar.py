@@ -0,0 +1,24 @@
+from django.db.models import Count
+
+from books.cache import acached, cached
+from books.models import Category
+
+
+def category_sidebar_queryset():
+    return Category.objects.annotate(book_count=Count('books')).order_by('id').values('id', 'name', 'book_count')
+
+
+def build_category_sidebar():
+    return list(category_sidebar_queryset())
+
+
+async def abuild_category_sidebar():
+    return [row async for row in category_sidebar_queryset()]
+
+
+def get_category_sidebar():
+    return cached('category_sidebar', build_category_sidebar, generations=('books', 'categories'))
+
+
+async def aget_category_sidebar():
+    return await acached('category_sidebar', abuild_category_sidebar, generations=('books', 'categories'))
@@ -1,13 +1,131 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from books.models import Book
+from accounts.models import CustomUser
+from books.models import (Book, BookShowed, BookDownloaded, Category, SendBook, SubCategory,
+                          recount_book_counters)
+from books.autocomplete import record_change
+from books.search import book_index
+from books.tasks import create_book_thumbnails, extract_book_metadata, send_telegram_notification
+from books.thumbnails import has_thumbnails
+from books.cache import bump_generation
+from books.isbn import normalize_isbn, to_isbn13
+from books.stored_files import acquire_file, release_file
 
 
 
+@receiver(pre_save, sender=Book)
+def normalize_book_isbn(sender, instance, **kwargs):
+    instance.isbn = normalize_isbn(instance.isbn)
+    instance.isbn13 = to_isbn13(instance.isbn)
+
+
 @receiver(post_save, sender=Book)
 def handle_book_creation(sender, instance, created, **kwargs):
     if created:
         if instance.file:
-            print('ishladimi')
+            send_telegram_notification.delay(instance.id)
+            extract_book_metadata.delay(instance.id)
+
+
+@receiver(post_save, sender=Book)
+def enqueue_book_thumbnails(sender, instance, **kwargs):
+    if instance.image and not has_thumbnails(instance.image.name, instance.image.storage):
+        create_book_thumbnails.delay(instance.id)
+
+
+@receiver(post_save, sender=BookShowed)
+def increment_views_count(sender, instance, created, **kwargs):
+    if created:
+        Book.objects.filter(pk=instance.book_id).update(views_count=F('views_count') + 1)
+
+
+@receiver(post_save, sender=BookDownloaded)
+def increment_downloads_count(sender, instance, created, **kwargs):
+    if created:
+        Book.objects.filter(pk=instance.book_id).update(downloads_count=F('downloads_count') + 1)
+
+
+# Event rows go through BookEventQuerySet.delete, or are fast-deleted by a
+# cascade; no post_delete receivers here, they would disable fast deletes.
+# A deleted book takes its counters with it, a deleted user is recounted.
+@receiver(pre_delete, sender=CustomUser)
+def remember_user_event_books(sender, instance, **kwargs):
+    instance._event_book_ids = {
+        model: set(model.objects.filter(user=instance).order_by().values_list('book_id', flat=True).distinct())
+        for model in (BookShowed, BookDownloaded)
+    }
+
+
+@receiver(post_delete, sender=CustomUser)
+def recount_user_event_books(sender, instance, **kwargs):
+    for model, book_ids in getattr(instance, '_event_book_ids', {}).items():
+        recount_book_counters(model, book_ids)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_search_index(sender, **kwargs):
+    book_index.invalidate()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def publish_autocomplete_change(sender, instance, **kwargs):
+    # Published after commit so other workers never re-read the old row.
+    pk = instance.pk
+    transaction.on_commit(lambda: record_change(pk))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def bump_books_generation(sender, **kwargs):
+    bump_generation('books')
+
+
+@receiver(post_save, sender=BookShowed)
+@receiver(post_save, sender=BookDownloaded)
+def bump_counters_generation(sender, **kwargs):
+    bump_generation('counters')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def bump_categories_generation(sender, **kwargs):
+    bump_generation('categories')
+
+
+def loaded_file_name(instance):
+    # Read the raw attribute so a deferred file field is not fetched.
+    value = instance.__dict__.get('file')
+    return getattr(value, 'name', value) or None
+
+
+@receiver(post_init, sender=Book)
+@receiver(post_init, sender=SendBook)
+def remember_file_name(sender, instance, **kwargs):
+    instance._stored_file_name = loaded_file_name(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=SendBook)
+def update_file_references(sender, instance, **kwargs):
+    if 'file' not in instance.__dict__:
+        return
+    name = loaded_file_name(instance)
+    if name != instance._stored_file_name:
+        if name:
+            acquire_file(name)
+        if instance._stored_file_name:
+            release_file(instance._stored_file_name)
+        instance._stored_file_name = name
+
 
-            # send_telegram_notification.delay(instance.id)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=SendBook)
+def release_file_reference(sender, instance, **kwargs):
+    if instance._stored_file_name:
+        release_file(instance._stored_file_name)
@@ -0,0 +1,54 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from books.cache import bump_generation
+from books.models import BookDailyStats, BookDownloaded, BookShowed
+
+TRENDING_WINDOWS = {
+    'trending_7d': 7,
+    'trending_30d': 30,
+}
+
+
+def count_events(model, since):
+    events = model.objects.filter(created_at__isnull=False)
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    return (events.order_by().values('book_id', 'created_at')
+            .annotate(total=Count('id')).values_list('book_id', 'created_at', 'total'))
+
+
+def rollup_daily_stats(since=None, batch_size=5000):
+    # Without an explicit start the last rolled-up day is recomputed, because
+    # it was probably still in progress when the previous run happened.
+    if since is None:
+        since = BookDailyStats.objects.aggregate(last=Max('day'))['last']
+
+    totals = defaultdict(lambda: [0, 0])
+    for book_id, day, views in count_events(BookShowed, since).iterator():
+        totals[book_id, day][0] = views
+    for book_id, day, downloads in count_events(BookDownloaded, since).iterator():
+        totals[book_id, day][1] = downloads
+
+    with transaction.atomic():
+        stale = BookDailyStats.objects.all()
+        if since is not None:
+            stale = stale.filter(day__gte=since)
+        stale.delete()
+        BookDailyStats.objects.bulk_create([
+            BookDailyStats(book_id=book_id, day=day, views=views, downloads=downloads)
+            for (book_id, day), (views, downloads) in totals.items()
+        ], batch_size=batch_size)
+    bump_generation('counters')
+    return since, len(totals)
+
+
+def annotate_trending(queryset, days):
+    # Filtering before annotating makes the join start from the (day, book)
+    # index and limits the list to books that were active in the window.
+    since = timezone.localdate() - timedelta(days=days - 1)
+    return queryset.filter(daily_stats__day__gte=since).annotate(trend_views=Sum('daily_stats__views'))
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_DIRECTORY = 'books/sha256'
+CONTENT_NAME_RE = re.compile(r'^books/sha256/[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?$')
+
+
+def content_name(sha256, extension=''):
+    return f'{CONTENT_DIRECTORY}/{sha256[:2]}/{sha256}{extension.lower()}'
+
+
+def sha256_from_name(name):
+    match = CONTENT_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    # Files are named after the SHA-256 of their content, so saving a file
+    # that is already stored returns the existing name instead of a copy.
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory = self.path(CONTENT_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            hasher = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    f.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            return self.place(temp_path, hasher.hexdigest(), os.path.splitext(name)[1])
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def place(self, path, sha256, extension=''):
+        name = content_name(sha256, extension)
+        target = self.path(name)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        return name
+
+    def adopt(self, name, sha256):
+        # Moves a file that already lives in this storage under its content
+        # name. Renaming is metadata only, the bytes are not copied.
+        return self.place(self.path(name), sha256, os.path.splitext(name)[1])
+
+
+book_storage = ContentAddressedStorage()
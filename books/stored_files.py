@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models import F
+
+from books.models import StoredFile
+from books.storage import book_storage, sha256_from_name
+
+
+def acquire_file(name):
+    sha256 = sha256_from_name(name)
+    if sha256 is None:
+        return
+    stored, _ = StoredFile.objects.get_or_create(
+        name=name, defaults={'sha256': sha256, 'size': book_storage.size(name)}
+    )
+    StoredFile.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release_file(name):
+    if sha256_from_name(name) is None:
+        return
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(name=name).first()
+        if stored is None:
+            return
+        if stored.ref_count > 1:
+            StoredFile.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') - 1)
+            return
+        stored.delete()
+        transaction.on_commit(lambda: book_storage.delete(name))
@@ -0,0 +1,44 @@
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from books.cache import bump_generation
+from books.jobs import task
+from books.models import Book
+from books.thumbnails import generate_thumbnails
+
+
+def touch_book(book_id, **fields):
+    # Queryset updates skip auto_now and the post_save signals, so move the
+    # conditional GET validators along by hand.
+    Book.objects.filter(pk=book_id).update(updated_at=timezone.now(), **fields)
+    bump_generation('books')
+
+
+@task
+def send_telegram_notification(book_id):
+    book = Book.objects.filter(pk=book_id).first()
+    if book is None or not settings.TELEGRAM_BOT_TOKEN:
+        return
+    response = requests.post(
+        f'https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage',
+        data={'chat_id': settings.TELEGRAM_CHAT_ID, 'text': f"Yangi kitob qo'shildi: {book.title} ({book.author})"},
+        timeout=10,
+    )
+    response.raise_for_status()
+
+
+@task
+def create_book_thumbnails(book_id):
+    book = Book.objects.filter(pk=book_id).only('image').first()
+    if book is not None and book.image:
+        if generate_thumbnails(book.image.name, book.image.storage):
+            touch_book(book_id)
+
+
+@task
+def extract_book_metadata(book_id):
+    book = Book.objects.filter(pk=book_id).only('file', 'size').first()
+    if book is None or not book.file or book.size:
+        return
+    touch_book(book_id, size=book.file.size)
@@ -1,8 +1,49 @@
 from django import template
+from django.conf import settings
+
+from books.cache import cache_timeout, get_version
+from books.thumbnails import THUMBNAIL_WIDTHS, has_thumbnails, thumbnail_name
 
 register = template.Library()
 
 @register.filter
 def chunked(iterable, chunk_size):
     for i in range(0, len(iterable), chunk_size):
-        yield iterable[i:i + chunk_size]
\ No newline at end of file
+        yield iterable[i:i + chunk_size]
+
+@register.simple_tag
+def cache_version(*names):
+    return get_version(*names)
+
+
+@register.simple_tag
+def fragment_timeout(seconds):
+    return cache_timeout(seconds)
+
+
+@register.simple_tag
+def upload_chunk_size():
+    return settings.BOOK_UPLOAD_CHUNK_SIZE
+
+
+@register.filter
+def thumbnails_ready(image):
+    # Thumbnails are made by a queued job, covers fall back to the original
+    # until it has run.
+    return bool(image) and has_thumbnails(image.name, image.storage)
+
+
+@register.filter
+def thumbnail_url(image, width):
+    if not image:
+        return ''
+    return image.storage.url(thumbnail_name(image.name, int(width)))
+
+
+@register.simple_tag
+def thumbnail_srcset(image, fmt='jpeg'):
+    if not image:
+        return ''
+    return ', '.join(
+        f'{image.storage.url(thumbnail_name(image.name, width, fmt))} {width}w' for width in THUMBNAIL_WIDTHS
+    )
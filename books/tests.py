@@ -1,3 +1,1568 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from datetime import timedelta
+from importlib import import_module
+import tempfile
+from unittest import mock, skipUnless
+import time
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db import DatabaseError, OperationalError, connection
+from django.http import Http404, HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from books.autocomplete import autocomplete_index
+from books.benchmarks import compare_results, percentile, run_benchmarks
+from books.buffers import BookShowedBuffer, book_showed_buffer
+from books.cache import bump_generation, cached, get_version
+from books.catalogue import ORDERINGS, CatalogueFilter, get_catalogue_queryset
+from books.pagination import CursorPaginator
+from books.middleware import PerformanceMiddleware, get_worst_requests, record_worst_request, worst_floors
+from books.jobs import claim_next_job, run_job, task
+from books import uploads
+from books.models import (Book, BookDailyStats, Category, BookShowed, BookDownloaded, Job, SendBook, StoredFile,
+                          SubCategory, Upload)
+from books.stats import count_events, rollup_daily_stats
+from books.storage import content_name
+from books.forms import BookForm
+from books.isbn import to_isbn13
+from books.search import InvertedIndex, PostgresSearchBackend, PythonSearchBackend
+from books.thumbnails import thumbnail_name, thumbnail_names
+from books.sidebar import get_category_sidebar
+from books.views import (AsyncBookDetailView, AsyncBookListView, AsyncCategoryBookListView, BookListView,
+                         get_latest_books)
+
+
+CustomUser = get_user_model()
+
+# A flusher thread would write through its own connection, outside the test
+# transaction; tests flush inline instead, see BackgroundFlushTest. The test
+# run is a single process, so its local cache counts as shared.
+module_settings = override_settings(BOOK_VIEW_BUFFER_BACKGROUND=False, BOOK_AUTOCOMPLETE_BACKGROUND=False,
+                                   BOOK_GENERATION_CACHE=True)
+
+
+def setUpModule():
+    module_settings.enable()
+
+
+def tearDownModule():
+    module_settings.disable()
+    # Views buffered by the last tests would be flushed at exit, after the
+    # test database is gone.
+    book_showed_buffer.clear()
+
+
+def create_book(category, **kwargs):
+    data = {
+        'title': 'Test Book',
+        'description': 'Test description',
+        'author': 'Test Author',
+        'year': 2020,
+        'pages': 100,
+        'category': category,
+    }
+    data.update(kwargs)
+    return Book.objects.create(**data)
+
+
+class BookCountersTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Fiction')
+        self.book = create_book(self.category)
+        self.user = CustomUser.objects.create_user(username='reader', password='testpassword123')
+
+    def test_counters_follow_event_rows(self):
+        showed = BookShowed.objects.create(book=self.book, user=self.user)
+        BookShowed.objects.create(book=self.book, user=self.user)
+        BookDownloaded.objects.create(book=self.book, user=self.user)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.views_count, 2)
+        self.assertEqual(self.book.downloads_count, 1)
+
+        showed.delete()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.views_count, 1)
+
+    def test_deletes_keep_counters_without_per_row_work(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword123')
+        for user in (self.user, other, other):
+            BookShowed.objects.create(book=self.book, user=user)
+        BookDownloaded.objects.create(book=self.book, user=other)
+        other.delete()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.views_count, self.book.downloads_count), (1, 0))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.book.delete()
+        # Fast delete: the cascade never loads the event rows.
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('SELECT')
+                          and 'books_bookshowed' in q['sql']])
+        self.assertFalse(BookShowed.objects.exists())
+
+    def test_rebuild_book_counters_command(self):
+        BookShowed.objects.create(book=self.book, user=self.user)
+        BookDownloaded.objects.create(book=self.book, user=self.user)
+        Book.objects.update(views_count=42, downloads_count=7)
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.views_count, 1)
+        self.assertEqual(self.book.downloads_count, 1)
+
+    def test_book_list_orders_by_views_count(self):
+        popular = create_book(self.category, title='Popular')
+        Book.objects.filter(pk=popular.pk).update(views_count=10)
+        response = Client().get(reverse('books:book_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['all_books'])[0], popular)
+
+
+@override_settings(BOOK_VIEW_BUFFER_SIZE=3, BOOK_VIEW_BUFFER_INTERVAL=3600)
+class BookShowedBufferTest(TestCase):
+
+    def setUp(self):
+        book_showed_buffer.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.book = create_book(self.category)
+        self.user = CustomUser.objects.create_user(username='reader', password='testpassword123')
+        self.client = Client()
+        self.client.login(username='reader', password='testpassword123')
+
+    def tearDown(self):
+        book_showed_buffer.clear()
+
+    def test_detail_view_buffers_showed_events(self):
+        response = self.client.get(reverse('books:book_detail', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(book_showed_buffer), 1)
+        self.assertFalse(BookShowed.objects.exists())
+
+    def test_buffer_flushes_when_full(self):
+        for _ in range(3):
+            self.client.get(reverse('books:book_detail', args=[self.book.pk]))
+        self.assertEqual(len(book_showed_buffer), 0)
+        self.assertEqual(BookShowed.objects.filter(book=self.book).count(), 3)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.views_count, 3)
+
+    @override_settings(BOOK_VIEW_BUFFER_INTERVAL=0)
+    def test_buffer_flushes_when_interval_elapsed(self):
+        self.client.get(reverse('books:book_detail', args=[self.book.pk]))
+        self.assertEqual(BookShowed.objects.filter(book=self.book).count(), 1)
+
+    def test_flush_skips_deleted_books(self):
+        other = create_book(self.category, title='Other')
+        book_showed_buffer.add(other.pk, self.user.pk)
+        book_showed_buffer.add(self.book.pk, self.user.pk)
+        other.delete()
+        self.assertEqual(book_showed_buffer.flush(), 1)
+        self.assertEqual(BookShowed.objects.count(), 1)
+
+    @override_settings(BOOK_VIEW_BUFFER_SIZE=10, BOOK_VIEW_BUFFER_MAX_PENDING=3)
+    def test_failed_flush_keeps_events_for_a_retry(self):
+        book_showed_buffer.add(self.book.pk, self.user.pk)
+        book_showed_buffer.add(self.book.pk, self.user.pk)
+        with mock.patch.object(BookShowed.objects, 'bulk_create', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                book_showed_buffer.flush()
+            self.assertEqual(len(book_showed_buffer), 2)
+            book_showed_buffer.add(self.book.pk, self.user.pk)
+            book_showed_buffer.add(self.book.pk, self.user.pk)
+            with self.assertRaises(DatabaseError), self.assertLogs('books.buffers', 'WARNING'):
+                book_showed_buffer.flush()
+        self.assertEqual(len(book_showed_buffer), 3)
+        self.assertEqual(book_showed_buffer.flush(), 3)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.views_count, 3)
+
+
+@override_settings(BOOK_VIEW_BUFFER_BACKGROUND=True, BOOK_VIEW_BUFFER_SIZE=2, BOOK_VIEW_BUFFER_INTERVAL=1)
+class BackgroundFlushTest(TransactionTestCase):
+
+    def setUp(self):
+        self.book = create_book(Category.objects.create(name='Fiction'))
+        self.user = CustomUser.objects.create_user(username='reader', password='testpassword123')
+        self.buffer = BookShowedBuffer()
+
+    def wait_for_rows(self, count):
+        deadline = time.monotonic() + 5
+        found = 0
+        while found < count and time.monotonic() < deadline:
+            time.sleep(0.05)
+            try:
+                found = BookShowed.objects.count()
+            except OperationalError:
+                # SQLite's shared in-memory database locks the table while
+                # the flusher writes.
+                pass
+        return found
+
+    def test_flusher_thread_drains_the_buffer(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.buffer.add(self.book.pk, self.user.pk)
+        self.assertEqual(len(queries), 0)
+        # A single event is written by the timer, without a second request.
+        self.assertEqual(self.wait_for_rows(1), 1)
+        self.buffer.add(self.book.pk, self.user.pk)
+        self.buffer.add(self.book.pk, self.user.pk)
+        self.assertEqual(self.wait_for_rows(3), 3)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.views_count, 3)
+
+
+
+class BookSearchTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Fiction')
+        self.war = create_book(self.category, title='War and Peace', author='Leo Tolstoy', isbn='9780140447934')
+        self.anna = create_book(self.category, title='Anna Karenina', author='Leo Tolstoy')
+        self.idiot = create_book(self.category, title='The Idiot', author='Fyodor Dostoevsky')
+        self.backend = PythonSearchBackend(InvertedIndex())
+
+    def test_search_matches_all_terms_with_prefixes(self):
+        results = self.backend.search(Book.objects.all(), 'tolst peace')
+        self.assertEqual(list(results), [self.war])
+
+    def test_search_ranks_by_term_frequency(self):
+        peace = create_book(self.category, title='Peace Peace', author='Unknown')
+        results = list(self.backend.search(Book.objects.all(), 'peace'))
+        self.assertEqual(results, [peace, self.war])
+
+    def test_search_respects_queryset_filters(self):
+        other = Category.objects.create(name='Other')
+        create_book(other, title='Tolstoy biography')
+        results = self.backend.search(Book.objects.filter(category=self.category), 'tolstoy')
+        self.assertCountEqual(results, [self.war, self.anna])
+
+    def test_search_empty_query(self):
+        self.assertFalse(self.backend.search(Book.objects.all(), '  ').exists())
+
+    def test_book_list_q_parameter(self):
+        response = Client().get(reverse('books:book_list'), {'q': 'dostoevsky'})
+        self.assertEqual(list(response.context['all_books']), [self.idiot])
+
+    def test_index_is_rebuilt_after_book_changes(self):
+        response = Client().get(reverse('books:book_list'), {'q': 'karamazov'})
+        self.assertEqual(list(response.context['all_books']), [])
+        karamazov = create_book(self.category, title='The Brothers Karamazov')
+        response = Client().get(reverse('books:book_list'), {'q': 'karamazov'})
+        self.assertEqual(list(response.context['all_books']), [karamazov])
+
+
+class CursorPaginatorTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Fiction')
+        self.books = [create_book(category, title=f'Book {i}') for i in range(7)]
+        # Two books share a views_count so the id tie-breaker is exercised.
+        for book, views in zip(self.books, [5, 5, 4, 3, 2, 1, 0]):
+            Book.objects.filter(pk=book.pk).update(views_count=views)
+        self.ordered = list(Book.objects.order_by('-views_count', '-id'))
+        self.paginator = CursorPaginator(Book.objects.all(), 3)
+
+    def test_walk_forward_and_back(self):
+        with self.assertNumQueries(1):
+            first = self.paginator.page()
+            self.assertEqual(list(first), self.ordered[:3])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+        second = self.paginator.page(first.next_cursor)
+        self.assertEqual(list(second), self.ordered[3:6])
+        third = self.paginator.page(second.next_cursor)
+        self.assertEqual(list(third), self.ordered[6:])
+        self.assertFalse(third.has_next())
+
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), self.ordered[3:6])
+        self.assertEqual(list(self.paginator.page(back.previous_cursor)), self.ordered[:3])
+
+    def test_last_page(self):
+        last = self.paginator.page('last')
+        self.assertEqual(list(last), self.ordered[4:])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'WyJ4IiwgW11d', '!!!'):
+            with self.assertRaises(PageNotAnInteger):
+                self.paginator.page(cursor)
+
+    def test_empty_page(self):
+        third = self.paginator.page(self.paginator.page(self.paginator.page().next_cursor).next_cursor)
+        cursor = self.paginator.encode_cursor('n', third[-1])
+        with self.assertRaises(EmptyPage):
+            self.paginator.page(cursor)
+
+    def test_book_list_falls_back_on_bad_cursor(self):
+        response = Client().get(reverse('books:book_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['all_books']), self.ordered[:6])
+
+
+class CategorySidebarTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fiction = Category.objects.create(name='Fiction')
+        self.science = Category.objects.create(name='Science')
+        create_book(self.fiction)
+        create_book(self.fiction)
+
+    def test_sidebar_counts_books_per_category(self):
+        self.assertEqual(get_category_sidebar(), [
+            {'id': self.fiction.pk, 'name': 'Fiction', 'book_count': 2},
+            {'id': self.science.pk, 'name': 'Science', 'book_count': 0},
+        ])
+
+    def test_sidebar_is_cached(self):
+        get_category_sidebar()
+        with self.assertNumQueries(0):
+            get_category_sidebar()
+
+    def test_sidebar_invalidated_on_changes(self):
+        get_category_sidebar()
+        book = create_book(self.science)
+        self.assertEqual(get_category_sidebar()[1]['book_count'], 1)
+        book.delete()
+        self.assertEqual(get_category_sidebar()[1]['book_count'], 0)
+        Category.objects.create(name='History')
+        self.assertEqual(len(get_category_sidebar()), 3)
+
+    def test_book_list_renders_sidebar(self):
+        response = Client().get(reverse('books:book_list'))
+        self.assertContains(response, 'Fiction (2 ta)')
+
+
+class CatalogueQueryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fiction = Category.objects.create(name='Fiction')
+        self.science = Category.objects.create(name='Science')
+        self.old = create_book(self.fiction, title='Old', year=1950)
+        self.new = create_book(self.fiction, title='New', year=2020)
+        self.other = create_book(self.science, title='Other', year=2000)
+
+    def test_from_query_params(self):
+        spec = CatalogueFilter.from_query_params(
+            {'year': '2000', 'author': ' Tolstoy ', 'ordering': 'bogus', 'category': 'x'}, category_id=3)
+        self.assertEqual(spec, CatalogueFilter(category_id=3, year_from=2000, year_to=2000, author='Tolstoy'))
+        spec = CatalogueFilter.from_query_params({'year_from': '1990', 'ordering': 'title', 'q': 'war'})
+        self.assertEqual((spec.year_from, spec.year_to, spec.ordering), (1990, None, 'title'))
+        self.assertEqual(spec.order_by, ('-rank', '-views_count', '-id'))
+
+    def test_filters_and_orderings(self):
+        queryset = get_catalogue_queryset(CatalogueFilter(category_id=self.fiction.pk, ordering='year'))
+        self.assertEqual(list(queryset), [self.new, self.old])
+        queryset = get_catalogue_queryset(CatalogueFilter(year_from=1990, year_to=2010))
+        self.assertEqual(list(queryset), [self.other])
+        queryset = get_catalogue_queryset(CatalogueFilter(ordering='title'))
+        self.assertEqual(list(queryset), [self.new, self.old, self.other])
+
+    def test_category_view_ignores_invalid_year(self):
+        url = reverse('books:category_book_list', args=[self.fiction.pk])
+        response = Client().get(url, {'year': 'abc', 'ordering': 'title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['all_books']), [self.new, self.old])
+
+    def test_every_supported_combination_uses_an_index(self):
+        filters = [
+            {},
+            {'category_id': self.fiction.pk},
+            {'sub_category_id': 1},
+            {'year_from': 1990, 'year_to': 2010},
+            {'author': 'Tolstoy'},
+            {'isbn': '978'},
+            {'isbn': '9780140447934'},
+        ]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for ordering in ORDERINGS:
+                for extra in filters:
+                    with self.subTest(ordering=ordering, **extra):
+                        queryset = get_catalogue_queryset(CatalogueFilter(ordering=ordering, **extra))[:7]
+                        plan = queryset.explain()
+                        if connection.vendor == 'postgresql':
+                            self.assertNotIn('Seq Scan', plan)
+                        else:
+                            self.assertIn('USING INDEX', plan)
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram indexes only exist on PostgreSQL')
+    def test_substring_filters_use_the_trigram_indexes(self):
+        backend = PostgresSearchBackend()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for field, value in (('title', 'peac'), ('author', 'tolst'), ('isbn', '0447')):
+                with self.subTest(field=field):
+                    plan = backend.filter(Book.objects.all(), field, value).order_by().explain()
+                    self.assertIn(f'book_{field}_upper_trgm_idx', plan)
+
+
+class FragmentCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.book = create_book(self.category, title='First')
+
+    def test_cached_value_follows_generation(self):
+        calls = []
+        builder = lambda: calls.append(1) or len(calls)
+        self.assertEqual(cached('fragment', builder, generations=('test',)), 1)
+        self.assertEqual(cached('fragment', builder, generations=('test',)), 1)
+        bump_generation('test')
+        self.assertEqual(cached('fragment', builder, generations=('test',)), 2)
+
+    def test_generation_survives_eviction(self):
+        version = get_version('test')
+        cache.delete('books:generation:test')
+        bump_generation('test')
+        self.assertNotEqual(get_version('test'), version)
+
+    @override_settings(BOOK_GENERATION_CACHE=False, BOOK_LOCAL_CACHE_TIMEOUT=30)
+    def test_per_process_cache_expires_quickly(self):
+        calls = []
+        builder = lambda: calls.append(1) or len(calls)
+        self.assertEqual(cached('fragment', builder), 1)
+        self.assertEqual(cached('fragment', builder), 1)
+        response = self.client.get(reverse('books:book_list'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('books:book_list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        detail_url = reverse('books:book_detail', args=[self.book.pk])
+        response = self.client.get(detail_url)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 31):
+            self.assertEqual(cached('fragment', builder), 2)
+            self.assertEqual(self.client.get(reverse('books:book_list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_latest_books_cached_until_book_changes(self):
+        self.assertEqual(get_latest_books(), [{'id': self.book.pk, 'title': 'First'}])
+        with self.assertNumQueries(0):
+            get_latest_books()
+        second = create_book(self.category, title='Second')
+        self.assertEqual(get_latest_books()[0], {'id': second.pk, 'title': 'Second'})
+
+    @override_settings(AUTHENTICATION_BACKENDS=['accounts.backends.CachedModelBackend'],
+                       SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_sidebar_fragments_are_cached(self):
+        # Logged in, so the anonymous page cache does not hide the fragments.
+        CustomUser.objects.create_user(username='reader', password='Password123!')
+        self.client.login(username='reader', password='Password123!')
+        url = reverse('books:book_list')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'Fiction (1 ta)')
+        self.assertContains(response, 'First')
+        create_book(self.category, title='Second')
+        response = self.client.get(url)
+        self.assertContains(response, 'Fiction (2 ta)')
+
+
+class DownloadBookViewTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BOOK_DOWNLOAD_OFFLOAD='')
+        self.settings_override.enable()
+        self.content = bytes(range(256)) * 4
+        category = Category.objects.create(name='Fiction')
+        self.book = create_book(category, file=SimpleUploadedFile('book.pdf', self.content))
+        self.user = CustomUser.objects.create_user(username='reader', password='testpassword123')
+        self.client = Client()
+        self.client.login(username='reader', password='testpassword123')
+        self.url = reverse('books:book_download', args=[self.book.pk])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="test-book.pdf"', response['Content-Disposition'])
+        self.assertEqual(BookDownloaded.objects.filter(book=self.book, user=self.user).count(), 1)
+
+    def test_repeated_download_is_counted_once(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.downloads_count, 1)
+
+    def test_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertFalse(BookDownloaded.objects.exists())
+
+    def test_suffix_and_open_ended_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(b''.join(response.streaming_content), self.content[1000:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_mismatch_sends_full_file(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_accel_redirect_offload(self):
+        with override_settings(BOOK_DOWNLOAD_OFFLOAD='nginx', BOOK_DOWNLOAD_ACCEL_PREFIX='/protected/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.book.file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(BookDownloaded.objects.count(), 1)
+
+    def test_login_required(self):
+        response = Client().get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class GenerateBooksCommandTest(TestCase):
+
+    def generate(self, **options):
+        call_command('generate_books', stdout=StringIO(), batch_size=7, **options)
+
+    def test_generates_dataset(self):
+        self.generate(books=20, users=5, views=200, downloads=30, seed=1, workers=2)
+        self.assertEqual(Book.objects.count(), 20)
+        self.assertEqual(CustomUser.objects.count(), 5)
+        self.assertEqual(BookShowed.objects.count(), 200)
+        self.assertTrue(Category.objects.exists())
+        self.assertEqual(sum(Book.objects.values_list('views_count', flat=True)), 200)
+        self.assertEqual(sum(Book.objects.values_list('downloads_count', flat=True)), BookDownloaded.objects.count())
+
+    def test_caches_are_invalidated(self):
+        self.generate(books=5, seed=4)
+        versions = {name: get_version(name) for name in ('books', 'categories', 'counters')}
+        changes = cache.get('autocomplete:changes')
+        self.generate(books=5, seed=5)
+        self.assertNotEqual(get_version('books'), versions['books'])
+        self.assertEqual(get_version('categories'), versions['categories'])
+        self.assertNotEqual(cache.get('autocomplete:changes'), changes)
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.assertNotEqual(get_version('counters'), versions['counters'])
+
+    def test_popularity_is_skewed(self):
+        self.generate(books=50, users=3, views=2000, seed=2)
+        counts = sorted(Book.objects.values_list('views_count', flat=True), reverse=True)
+        self.assertGreater(sum(counts[:5]), sum(counts[25:]))
+
+    def test_seed_is_deterministic(self):
+        self.generate(books=10, seed=3)
+        first = list(Book.objects.order_by('id').values_list('title', 'isbn'))
+        Book.objects.all().delete()
+        self.generate(books=10, seed=3)
+        self.assertEqual(list(Book.objects.order_by('id').values_list('title', 'isbn')), first)
+
+
+class ThumbnailTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BOOK_JOBS_EAGER=True)
+        self.settings_override.enable()
+        self.category = Category.objects.create(name='Fiction')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def make_image(self, name='cover.png', size=(1200, 1800)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 10, 10, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_thumbnails_created_on_save(self):
+        book = create_book(self.category, image=self.make_image())
+        storage = book.image.storage
+        for name in thumbnail_names(book.image.name):
+            self.assertTrue(storage.exists(name), name)
+        with storage.open(thumbnail_name(book.image.name, 480, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (480, 720))
+
+    def test_small_images_are_not_upscaled(self):
+        book = create_book(self.category, image=self.make_image(size=(100, 150)))
+        with book.image.storage.open(thumbnail_name(book.image.name, 960)) as f:
+            self.assertEqual(Image.open(f).size, (100, 150))
+
+    def test_backfill_command(self):
+        book = create_book(self.category, image=self.make_image())
+        for name in thumbnail_names(book.image.name):
+            book.image.storage.delete(name)
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('wrote 6 thumbnails', out.getvalue())
+        self.assertTrue(book.image.storage.exists(thumbnail_name(book.image.name, 240)))
+
+    def test_list_renders_srcset(self):
+        book = create_book(self.category, image=self.make_image())
+        response = Client().get(reverse('books:book_list'))
+        self.assertContains(response, book.image.storage.url(thumbnail_name(book.image.name, 480, 'webp')) + ' 480w')
+
+    def test_original_image_until_thumbnails_exist(self):
+        with override_settings(BOOK_JOBS_EAGER=False):
+            book = create_book(self.category, image=self.make_image())
+        for url in (reverse('books:book_list'), reverse('books:book_detail', args=[book.pk])):
+            response = Client().get(url)
+            self.assertContains(response, f'src="{book.image.url}"')
+            self.assertNotContains(response, thumbnail_name(book.image.name, 480))
+
+
+flaky_calls = []
+
+
+@task(max_attempts=2)
+def flaky_task(value):
+    flaky_calls.append(value)
+    raise RuntimeError('boom')
+
+
+@override_settings(BOOK_JOBS_EAGER=False, TELEGRAM_BOT_TOKEN='')
+class JobRunnerTest(TestCase):
+
+    def setUp(self):
+        flaky_calls.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.category = Category.objects.create(name='Fiction')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_book_creation_enqueues_side_effects(self):
+        book = create_book(self.category, file=SimpleUploadedFile('book.pdf', b'x' * 2048))
+        self.assertCountEqual(Job.objects.values_list('name', flat=True), [
+            'books.tasks.send_telegram_notification',
+            'books.tasks.extract_book_metadata',
+            'books.tasks.create_book_thumbnails',
+        ])
+        call_command('run_jobs', burst=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+        book.refresh_from_db()
+        self.assertEqual(book.size, 2048)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = flaky_task.delay(7)
+        with self.assertLogs('books.jobs', 'WARNING'):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertIsNone(claim_next_job())
+
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        with self.assertLogs('books.jobs', 'WARNING'):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(flaky_calls, [7, 7])
+
+    def test_unknown_task_fails_immediately(self):
+        job = Job.objects.create(name='books.tasks.missing', run_at=timezone.now())
+        with self.assertLogs('books.jobs', 'WARNING'):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_prune_finished_jobs(self):
+        old = timezone.now() - timedelta(days=8)
+        for status in (Job.DONE, Job.FAILED, Job.QUEUED, Job.RUNNING):
+            Job.objects.create(name='books.tasks.old', status=status, run_at=old)
+        Job.objects.update(updated_at=old)
+        recent = Job.objects.create(name='books.tasks.recent', status=Job.DONE, run_at=timezone.now())
+        out = StringIO()
+        call_command('prune_jobs', days=7, batch_size=1, stdout=out)
+        self.assertIn('Deleted 2 finished jobs', out.getvalue())
+        self.assertCountEqual(Job.objects.values_list('status', flat=True), [Job.QUEUED, Job.RUNNING, recent.status])
+
+    @override_settings(BOOK_JOBS_EAGER=True)
+    def test_eager_mode_runs_inline(self):
+        with self.assertRaises(RuntimeError):
+            flaky_task.delay(1)
+        self.assertFalse(Job.objects.exists())
+
+
+class BenchmarkTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, TELEGRAM_BOT_TOKEN='')
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_run_benchmarks_reports_every_endpoint(self):
+        call_command('generate_books', books=15, users=3, views=50, seed=4, stdout=StringIO())
+        cache.clear()
+        results = run_benchmarks(iterations=3, warmup=1)
+        self.assertEqual(set(results), {
+            'book_list', 'book_list_search', 'book_list_deep', 'category_book_list',
+            'book_detail', 'book_detail_authenticated', 'download_book',
+        })
+        for result in results.values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['bytes'], 0)
+        self.assertEqual(results['book_list']['queries'], 0)
+        self.assertEqual(len(book_showed_buffer), 0)
+        self.assertIsNone(cache.get('books:generation:books'))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([3], 0.95), 3)
+
+    def test_compare_results(self):
+        baseline = {'book_list': {'p95_ms': 10.0, 'queries': 2}}
+        self.assertEqual(compare_results(baseline, {'book_list': {'p95_ms': 11.0, 'queries': 2}}), [])
+        regressions = compare_results(baseline, {'book_list': {'p95_ms': 13.0, 'queries': 3}})
+        self.assertEqual(len(regressions), 2)
+
+
+class PerformanceMiddlewareTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        worst_floors.clear()
+        self.category = Category.objects.create(name='Fiction')
+        create_book(self.category)
+
+    def test_server_timing_header(self):
+        response = Client().get(reverse('books:book_list'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertIn('cache;desc="', timing)
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+
+    @override_settings(PERFORMANCE_LOG_SAMPLE_RATE=1.0)
+    def test_sampled_log_line(self):
+        with self.assertLogs('books.performance', 'INFO') as logs:
+            Client().get(reverse('books:book_list'))
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['url_name'], 'books:book_list')
+        self.assertGreaterEqual(data['queries'], 1)
+        self.assertTrue(data['slowest'])
+
+    async def test_async_views_are_measured_without_a_thread_hop(self):
+        async def view(request):
+            return HttpResponse(str(await Book.objects.acount()))
+        middleware = PerformanceMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/books/'))
+        self.assertEqual(response.content, b'1')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    @override_settings(PERFORMANCE_WORST_REQUESTS=2)
+    def test_worst_requests_are_kept_per_url_name(self):
+        for _ in range(3):
+            Client().get(reverse('books:book_list'))
+        worst = get_worst_requests(['books:book_list', 'books:book_detail'])
+        self.assertEqual(len(worst['books:book_list']), 2)
+        self.assertEqual(worst['books:book_detail'], [])
+        self.assertGreaterEqual(worst['books:book_list'][0]['total_ms'], worst['books:book_list'][1]['total_ms'])
+
+    @override_settings(PERFORMANCE_WORST_REQUESTS=2)
+    def test_fast_requests_skip_the_shared_cache(self):
+        for total_ms in (30, 20):
+            record_worst_request({'url_name': 'books:book_list', 'total_ms': total_ms})
+        with mock.patch('books.middleware.cache') as shared:
+            record_worst_request({'url_name': 'books:book_list', 'total_ms': 5})
+        self.assertFalse(shared.method_calls)
+        record_worst_request({'url_name': 'books:book_list', 'total_ms': 25})
+        self.assertEqual([item['total_ms'] for item in get_worst_requests(['books:book_list'])['books:book_list']],
+                         [30, 25])
+
+    def test_report_is_superuser_only(self):
+        url = reverse('books:performance_report')
+        CustomUser.objects.create_user(username='reader', password='testpassword123')
+        CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='testpassword123')
+        Client().get(reverse('books:book_list'))
+
+        client = Client()
+        client.login(username='reader', password='testpassword123')
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.login(username='admin', password='testpassword123')
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'books:book_list')
+
+
+class DailyStatsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.old_hit = create_book(self.category, title='Old hit')
+        self.new_hit = create_book(self.category, title='New hit')
+        self.user = CustomUser.objects.create_user(username='reader', password='testpassword123')
+        self.today = timezone.localdate()
+
+    def add_views(self, book, count, days_ago):
+        for _ in range(count):
+            BookShowed.objects.create(book=book, user=self.user)
+        BookShowed.objects.filter(book=book, created_at=self.today).update(
+            created_at=self.today - timedelta(days=days_ago))
+
+    def test_rollup_counts_views_and_downloads_per_day(self):
+        self.add_views(self.old_hit, 3, days_ago=20)
+        self.add_views(self.old_hit, 1, days_ago=0)
+        BookDownloaded.objects.create(book=self.old_hit, user=self.user)
+        call_command('rollup_book_stats', stdout=StringIO())
+        stats = {(row.day, row.views, row.downloads) for row in BookDailyStats.objects.filter(book=self.old_hit)}
+        self.assertEqual(stats, {(self.today - timedelta(days=20), 3, 0), (self.today, 1, 1)})
+
+    def test_incremental_rollup_reads_the_created_at_index(self):
+        for model, index in ((BookShowed, 'book_showed_created_idx'), (BookDownloaded, 'book_downloaded_created_idx')):
+            with self.subTest(model=model.__name__):
+                self.assertIn(index, count_events(model, self.today).explain())
+
+    def test_incremental_rollup_recomputes_last_day_only(self):
+        self.add_views(self.old_hit, 2, days_ago=3)
+        rollup_daily_stats()
+        BookDailyStats.objects.filter(day=self.today - timedelta(days=3)).update(views=99)
+        self.add_views(self.new_hit, 4, days_ago=0)
+        since, rows = rollup_daily_stats()
+        self.assertEqual(since, self.today - timedelta(days=3))
+        self.assertEqual(BookDailyStats.objects.get(book=self.new_hit).views, 4)
+        self.assertEqual(BookDailyStats.objects.get(book=self.old_hit).views, 2)
+
+    def test_trending_orderings_read_from_rollup(self):
+        self.add_views(self.old_hit, 5, days_ago=20)
+        self.add_views(self.new_hit, 2, days_ago=1)
+        rollup_daily_stats()
+        BookShowed.objects.all().delete()
+
+        week = get_catalogue_queryset(CatalogueFilter(ordering='trending_7d'))
+        self.assertEqual(list(week), [self.new_hit])
+        month = get_catalogue_queryset(CatalogueFilter(ordering='trending_30d'))
+        self.assertEqual(list(month), [self.old_hit, self.new_hit])
+        self.assertEqual(month[0].trend_views, 5)
+
+    def test_trending_pages_with_cursor(self):
+        books = [create_book(self.category, title=f'Book {i}') for i in range(4)]
+        for views, book in enumerate(books, start=1):
+            self.add_views(book, views, days_ago=0)
+        rollup_daily_stats()
+        spec = CatalogueFilter(ordering='trending_7d')
+        paginator = CursorPaginator(get_catalogue_queryset(spec), 2, ordering=spec.order_by)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(list(first) + list(second), books[::-1])
+        self.assertFalse(second.has_next())
+        response = Client().get(reverse('books:book_list'), {'ordering': 'trending_7d'})
+        self.assertEqual(list(response.context['all_books']), books[::-1])
+
+
+class AsyncViewsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        book_showed_buffer.clear()
+        self.factory = AsyncRequestFactory()
+        self.fiction = Category.objects.create(name='Fiction')
+        self.science = Category.objects.create(name='Science')
+        self.books = [create_book(self.fiction, title=f'Book {i}') for i in range(8)]
+        self.science_book = create_book(self.science, title='Physics')
+        self.user = CustomUser.objects.create_user(username='reader', password='Password123!')
+
+    def get_request(self, path, data=None, user=None):
+        request = self.factory.get(path, data)
+        request.user = user or AnonymousUser()
+        return request
+
+    async def test_list_matches_sync_view(self):
+        request = self.get_request(reverse('books:book_list'), {'ordering': 'title'})
+        response = await AsyncBookListView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Fiction (8 ta)')
+        sync_view = sync_to_async(BookListView.as_view())
+        sync_response = await sync_view(self.get_request(reverse('books:book_list'), {'ordering': 'title'}))
+        self.assertEqual(response.content, sync_response.content)
+
+    async def test_list_with_search_and_cursor(self):
+        response = await AsyncBookListView.as_view()(self.get_request(reverse('books:book_list'), {'q': 'Physics'}))
+        self.assertContains(response, 'Physics')
+        response = await AsyncBookListView.as_view()(
+            self.get_request(reverse('books:book_list'), {'cursor': 'garbage'})
+        )
+        self.assertEqual(response.status_code, 200)
+
+    async def test_category_list(self):
+        view = AsyncCategoryBookListView.as_view()
+        response = await view(self.get_request('/books/category/', {}), category_id=self.science.pk)
+        self.assertContains(response, 'Physics')
+        self.assertContains(response, 'Book 0', count=1)
+
+    async def test_detail_records_authenticated_views(self):
+        view = AsyncBookDetailView.as_view()
+        book = self.books[0]
+        response = await view(self.get_request('/books/', user=self.user), pk=book.pk)
+        self.assertContains(response, book.title)
+        await view(self.get_request('/books/'), pk=book.pk)
+        await sync_to_async(book_showed_buffer.flush)()
+        self.assertEqual(await BookShowed.objects.filter(book=book).acount(), 1)
+
+    async def test_detail_missing_book(self):
+        with self.assertRaises(Http404):
+            await AsyncBookDetailView.as_view()(self.get_request('/books/'), pk=0)
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        book_showed_buffer.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.book = create_book(self.category)
+        self.user = CustomUser.objects.create_user(username='reader', password='Password123!')
+        self.detail_url = reverse('books:book_detail', args=[self.book.pk])
+        self.list_url = reverse('books:book_list')
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_with_book(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.book.title = 'Renamed'
+        self.book.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed')
+
+    def test_not_modified_still_counts_views(self):
+        self.client.login(username='reader', password='Password123!')
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        book_showed_buffer.flush()
+        self.assertEqual(BookShowed.objects.filter(book=self.book, user=self.user).count(), 2)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.client.login(username='reader', password='Password123!')
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_not_modified(self):
+        etag = self.client.get(self.list_url, {'ordering': 'title'})['ETag']
+        self.assertEqual(self.client.get(self.list_url, {'ordering': 'title'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.list_url, {'ordering': 'year'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_changes_with_catalogue(self):
+        etag = self.client.get(self.list_url)['ETag']
+        BookDownloaded.objects.create(book=self.book, user=self.user)
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(self.list_url)['ETag']
+        create_book(self.category, title='Another')
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_are_not_answered_with_304(self):
+        self.client.login(username='reader', password='Password123!')
+        etag = self.client.get(self.list_url)['ETag']
+        self.client.post(reverse('books:book_order'), {'book_name': 'Wanted', 'description': 'Please', 'author': 'Someone'})
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sizning habaringiz adminga yuborildi')
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.book = create_book(self.category, title='Cached Book')
+        self.list_url = reverse('books:book_list')
+
+    def test_anonymous_pages_are_cached(self):
+        response = self.client.get(self.list_url, {'title': 'Cached', 'ordering': 'title'})
+        self.assertContains(response, 'Cached Book')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url, {'ordering': 'title', 'title': ' Cached ', 'utm_source': 'x'})
+        self.assertContains(response, 'Cached Book')
+        self.assertIn('ETag', response)
+
+    def test_category_pages_are_cached_separately(self):
+        other = Category.objects.create(name='Science')
+        create_book(other, title='Physics')
+        self.assertContains(self.client.get(reverse('books:category_book_list', args=[self.category.pk])),
+                            'Cached Book')
+        response = self.client.get(reverse('books:category_book_list', args=[other.pk]))
+        self.assertContains(response, 'Physics')
+        self.assertContains(response, 'Cached Book', count=1)
+
+    def test_cache_invalidated_by_book_changes(self):
+        self.client.get(self.list_url)
+        self.book.title = 'Renamed Book'
+        self.book.save()
+        self.assertContains(self.client.get(self.list_url), 'Renamed Book')
+        self.category.name = 'Novels'
+        self.category.save()
+        self.assertContains(self.client.get(self.list_url), 'Novels')
+
+    def test_authenticated_users_bypass_cache(self):
+        self.client.get(self.list_url)
+        CustomUser.objects.create_user(username='reader', password='Password123!')
+        self.client.login(username='reader', password='Password123!')
+        self.assertContains(self.client.get(self.list_url), 'reader')
+
+
+class ChunkedUploadTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BOOK_UPLOAD_CHUNK_SIZE=100,
+                                                   BOOK_JOBS_EAGER=True, TELEGRAM_BOT_TOKEN='')
+        self.settings_override.enable()
+        self.content = bytes(range(256))
+        self.category = Category.objects.create(name='Fiction')
+        self.user = CustomUser.objects.create_user(username='uploader', password='Password123!')
+        self.client.login(username='uploader', password='Password123!')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_upload(self, size=None):
+        response = self.client.post(reverse('books:upload_create'),
+                                    {'filename': 'big book.pdf', 'size': size or len(self.content)})
+        self.assertEqual(response.status_code, 201)
+        return reverse('books:upload_chunk', args=[response.json()['id']]), response.json()
+
+    def put_chunk(self, url, start, end, total=None):
+        return self.client.put(url, self.content[start:end], content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{total or len(self.content)}')
+
+    def test_upload_in_chunks(self):
+        url, status = self.create_upload()
+        self.assertEqual(status['offset'], 0)
+        for start in range(0, len(self.content), 100):
+            response = self.put_chunk(url, start, min(start + 100, len(self.content)))
+            self.assertEqual(response.status_code, 200)
+        status = self.client.get(url).json()
+        self.assertTrue(status['complete'])
+        self.assertEqual(status['sha256'], hashlib.sha256(self.content).hexdigest())
+        upload = Upload.objects.get()
+        with open(os.path.join(self.media_root, upload.path), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_resume_after_interruption(self):
+        url, _ = self.create_upload()
+        self.put_chunk(url, 0, 100)
+        response = self.put_chunk(url, 150, 250)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+        # Chunks handled by another worker rebuild the hash from the partial file.
+        uploads._hashers.clear()
+        self.put_chunk(url, 100, 200)
+        response = self.put_chunk(url, 200, 256)
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.content).hexdigest())
+
+    def test_rejects_bad_chunks(self):
+        url, _ = self.create_upload()
+        self.assertEqual(self.put_chunk(url, 0, 150).status_code, 413)
+        self.assertEqual(self.client.put(url, b'x', content_type='application/octet-stream').status_code, 400)
+        self.assertEqual(self.put_chunk(url, 0, 100, total=1000).status_code, 400)
+        self.assertEqual(self.client.get(url).json()['offset'], 0)
+        response = self.client.post(reverse('books:upload_create'), {'filename': 'huge.pdf', 'size': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_uploads_belong_to_their_user(self):
+        url, _ = self.create_upload()
+        self.assertEqual(Upload.objects.get().user, self.user)
+        CustomUser.objects.create_user(username='other', email='other@example.com', password='Password123!')
+        self.client.login(username='other', password='Password123!')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.put_chunk(url, 0, 100).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.put_chunk(url, 0, 100).status_code, 302)
+        response = self.client.post(reverse('books:upload_create'), {'filename': 'big book.pdf', 'size': 10})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Upload.objects.count(), 1)
+
+    def test_forms_only_attach_own_uploads(self):
+        upload_id = self.upload_content()
+        CustomUser.objects.create_user(username='other', email='other@example.com', password='Password123!')
+        self.client.login(username='other', password='Password123!')
+        response = self.client.post(reverse('books:book_send'), {'book_name': 'Stolen', 'description': 'x',
+                                                                 'author': 'Someone', 'upload': upload_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('upload', response.context['form'].errors)
+        self.assertFalse(SendBook.objects.exists())
+        self.assertTrue(Upload.objects.filter(pk=upload_id).exists())
+
+    def test_book_form_attaches_finished_upload(self):
+        url, status = self.create_upload()
+        self.put_chunk(url, 0, 100)
+        data = {'title': 'Big Book', 'description': 'Long', 'author': 'Author', 'year': 2020, 'pages': 900,
+                'category': self.category.pk, 'upload': status['id']}
+        response = self.client.post(reverse('books:book_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Book.objects.filter(title='Big Book').exists())
+
+        self.put_chunk(url, 100, 200)
+        self.put_chunk(url, 200, 256)
+        response = self.client.post(reverse('books:book_create'), data)
+        self.assertRedirects(response, reverse('books:book_list'))
+        book = Book.objects.get(title='Big Book')
+        self.assertEqual(book.size, len(self.content))
+        self.assertEqual(book.file.name, content_name(hashlib.sha256(self.content).hexdigest(), '.pdf'))
+        self.assertFalse(Upload.objects.exists())
+
+    def upload_content(self):
+        url, status = self.create_upload()
+        for start in range(0, len(self.content), 100):
+            self.put_chunk(url, start, min(start + 100, len(self.content)))
+        return status['id']
+
+    def test_finished_upload_keeps_shared_content_alive(self):
+        data = {'title': 'Big Book', 'description': 'Long', 'author': 'Author', 'year': 2020, 'pages': 900,
+                'category': self.category.pk}
+        self.client.post(reverse('books:book_create'), {**data, 'upload': self.upload_content()})
+        first = Book.objects.get(title='Big Book')
+        upload_id = self.upload_content()
+        self.assertEqual(StoredFile.objects.get().ref_count, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, first.file.name)))
+        self.client.post(reverse('books:book_create'), {**data, 'title': 'Second', 'upload': upload_id})
+        second = Book.objects.get(title='Second')
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(StoredFile.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, second.file.name)))
+
+    def test_cleanup_releases_finished_uploads(self):
+        self.upload_content()
+        name = Upload.objects.get().path
+        Upload.objects.update(created_at=timezone.now() - timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('cleanup_uploads', stdout=StringIO())
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, name)))
+
+    def test_cleanup_stale_uploads(self):
+        self.create_upload()
+        upload = Upload.objects.get()
+        Upload.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('cleanup_uploads', stdout=StringIO())
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, upload.path)))
+
+
+class ContentAddressedStorageTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BOOK_JOBS_EAGER=True,
+                                                   TELEGRAM_BOT_TOKEN='')
+        self.settings_override.enable()
+        self.content = b'%PDF same book'
+        self.category = Category.objects.create(name='Fiction')
+        self.librarian = CustomUser.objects.create_user(username='librarian', email='librarian@example.com',
+                                                        password='Password123!', status='librarian')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def stored_files(self):
+        names = []
+        for root, _, files in os.walk(os.path.join(self.media_root, 'books')):
+            names.extend(os.path.join(root, name) for name in files)
+        return names
+
+    def test_duplicates_share_one_file(self):
+        first = create_book(self.category, file=SimpleUploadedFile('a.pdf', self.content))
+        second = create_book(self.category, file=SimpleUploadedFile('b.pdf', self.content))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(StoredFile.objects.get(name=first.file.name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredFile.objects.get().ref_count, 1)
+        self.assertEqual(len(self.stored_files()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        book = create_book(self.category, file=SimpleUploadedFile('a.pdf', self.content))
+        old_name = book.file.name
+        book = Book.objects.get(pk=book.pk)
+        book.file = SimpleUploadedFile('b.pdf', b'%PDF other book')
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertEqual(list(StoredFile.objects.values_list('name', flat=True)), [book.file.name])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, old_name)))
+
+    def test_promoting_a_submission_reuses_its_file(self):
+        send_book = SendBook.objects.create(user=self.librarian, book_name='Sent', description='Sent book',
+                                            author='Author', file=SimpleUploadedFile('sent.pdf', self.content))
+        self.client.login(username='librarian', password='Password123!')
+        url = reverse('books:book_sended_promote', args=[send_book.pk])
+        self.assertContains(self.client.get(url), 'value="Sent"')
+        response = self.client.post(url, {'title': 'Sent', 'description': 'Sent book', 'author': 'Author',
+                                          'year': 2020, 'pages': 10, 'category': self.category.pk})
+        book = Book.objects.get(title='Sent')
+        self.assertRedirects(response, reverse('books:book_detail', args=[book.pk]))
+        self.assertEqual(book.file.name, send_book.file.name)
+        self.assertEqual(book.size, len(self.content))
+        self.assertEqual(StoredFile.objects.get().ref_count, 2)
+        self.assertEqual(len(self.stored_files()), 1)
+        send_book.refresh_from_db()
+        self.assertTrue(send_book.status)
+
+    def test_dedupe_command_moves_legacy_files(self):
+        books = [create_book(self.category, title=f'Book {i}') for i in range(2)]
+        for i, book in enumerate(books):
+            name = default_storage.save(f'books/legacy{i}.pdf', ContentFile(self.content))
+            Book.objects.filter(pk=book.pk).update(file=name)
+        call_command('dedupe_book_files', stdout=StringIO())
+        names = set(Book.objects.values_list('file', flat=True))
+        self.assertEqual(names, {content_name(hashlib.sha256(self.content).hexdigest(), '.pdf')})
+        self.assertEqual(StoredFile.objects.get().ref_count, 2)
+        self.assertEqual(len(self.stored_files()), 1)
+
+
+class ImportBooksCommandTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.fiction = Category.objects.create(name='Fiction')
+        SubCategory.objects.create(category=self.fiction, name='Fantasy')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, content, opener=open):
+        path = os.path.join(self.directory, name)
+        with opener(path, 'wt') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_upserts_by_isbn(self):
+        path = self.write('books.csv', (
+            'title,author,description,year,pages,isbn,category,sub_category\n'
+            'Dune,Herbert,Sand,1965,412,978-0-441-17271-9,fiction,Fantasy\n'
+            'Emma,Austen,Match,1815,300,,Fiction,\n'
+            'Bad,Nobody,,notayear,1,111,Fiction,\n'
+            'Lost,Nobody,,2000,1,222,Poetry,\n'
+        ))
+        err = StringIO()
+        call_command('import_books', path, batch_size=1, stdout=StringIO(), stderr=err)
+        self.assertEqual(Book.objects.count(), 2)
+        dune = Book.objects.get(isbn='9780441172719')
+        self.assertEqual(dune.sub_category.name, 'Fantasy')
+        self.assertIn('line 4: year and pages must be integers', err.getvalue())
+        self.assertIn('line 5: Unknown category "Poetry"', err.getvalue())
+
+        Book.objects.filter(pk=dune.pk).update(views_count=7)
+        path = self.write('update.csv', 'title,author,year,pages,isbn,category\nDune Messiah,Herbert,1969,256,9780441172719,Fiction\n')
+        call_command('import_books', path, stdout=StringIO(), stderr=StringIO())
+        dune.refresh_from_db()
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(dune.title, 'Dune Messiah')
+        self.assertEqual(dune.views_count, 7)
+
+    def test_gzipped_jsonl_import(self):
+        rows = [{'title': f'Book {i}', 'author': 'Author', 'year': 2000 + i, 'pages': 10, 'isbn': f'isbn 100{i}',
+                 'category': 'Science'} for i in range(5)]
+        rows.append({'title': 'Book 0 again', 'author': 'Author', 'year': 2000, 'pages': 10, 'isbn': '1000',
+                     'category': 'Science'})
+        content = '\n'.join(json.dumps(row) for row in rows) + '\n{broken\n'
+        path = self.write('books.jsonl.gz', content, opener=gzip.open)
+        out, err = StringIO(), StringIO()
+        call_command('import_books', path, batch_size=4, create_categories=True, stdout=out, stderr=err)
+        self.assertEqual(Book.objects.filter(category__name='Science').count(), 5)
+        self.assertEqual(Book.objects.get(isbn='1000').title, 'Book 0 again')
+        self.assertIn('line 7', err.getvalue())
+        self.assertIn('skipped 1 of 7 rows', out.getvalue())
+        self.assertContains(self.client.get(reverse('books:book_list'), {'q': 'again'}), 'Book 0 again')
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.librarian = CustomUser.objects.create_user(username='librarian', email='librarian@example.com',
+                                                        password='Password123!', status='librarian')
+        self.reader = CustomUser.objects.create_user(username='reader', email='reader@example.com',
+                                                     password='Password123!')
+        category = Category.objects.create(name='Fiction')
+        self.dune = Book.objects.create(title='Dune, the novel', author='Herbert', description='Sand', year=1965,
+                                        pages=412, category=category, isbn='9780441172719')
+        self.emma = Book.objects.create(title='Emma', author='Austen', description='Match', year=1815, pages=300,
+                                        category=category)
+        Book.objects.filter(pk=self.emma.pk).update(created_at=timezone.now() - timedelta(days=10))
+        BookShowed.objects.create(book=self.dune, user=self.reader)
+
+    def test_only_librarians_can_export(self):
+        self.client.login(username='reader', password='Password123!')
+        self.assertEqual(self.client.get(reverse('books:export', args=['books'])).status_code, 403)
+        self.client.login(username='librarian', password='Password123!')
+        self.assertEqual(self.client.get(reverse('books:export', args=['users'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('books:export', args=['books']), {'from': 'soon'}).status_code, 400)
+
+    def test_csv_export_streams_rows(self):
+        self.client.login(username='librarian', password='Password123!')
+        response = self.client.get(reverse('books:export', args=['books']))
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="books-', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'title', 'author'])
+        self.assertEqual(len(lines), 3)
+        self.assertIn('"Dune, the novel"', lines[1])
+        self.assertIn('Fiction', lines[1])
+
+    def test_gzipped_jsonl_export_with_date_range(self):
+        self.client.login(username='librarian', password='Password123!')
+        since = (timezone.localdate() - timedelta(days=1)).isoformat()
+        response = self.client.get(reverse('books:export', args=['books']),
+                                   {'format': 'jsonl', 'gzip': '1', 'from': since})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Dune, the novel'])
+        self.assertEqual(rows[0]['category'], 'Fiction')
+
+    def test_export_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'views.csv.gz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_books', 'views', path, gzip=True, stdout=StringIO())
+        with gzip.open(path, 'rt') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'id,book_id,user_id,created_at')
+        self.assertEqual(lines[1].split(',')[1:3], [str(self.dune.pk), str(self.reader.pk)])
+
+
+class CatalogueApiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.fantasy = SubCategory.objects.create(category=self.category, name='Fantasy')
+        for i in range(5):
+            Book.objects.create(title=f'Book {i}', author='Author', description='Text', year=2000 + i, pages=10,
+                                category=self.category, sub_category=self.fantasy if i % 2 else None)
+            Book.objects.filter(title=f'Book {i}').update(views_count=i)
+
+    def test_sparse_fields_and_cursor_paging(self):
+        url = reverse('books:api_book_list')
+        with self.assertNumQueries(1):
+            data = self.client.get(url, {'fields': 'id,title,sub_category_name', 'per_page': 2}).json()
+        self.assertEqual(list(data['results'][0]), ['id', 'title', 'sub_category_name'])
+        self.assertEqual([row['title'] for row in data['results']], ['Book 4', 'Book 3'])
+        self.assertEqual(data['results'][1]['sub_category_name'], 'Fantasy')
+        self.assertIsNone(data['previous'])
+
+        titles = []
+        cursor = data['next']
+        while cursor:
+            data = self.client.get(url, {'fields': 'title', 'per_page': 2, 'cursor': cursor}).json()
+            titles += [row['title'] for row in data['results']]
+            cursor = data['next']
+        self.assertEqual(titles, ['Book 2', 'Book 1', 'Book 0'])
+
+    def test_computed_fields_and_errors(self):
+        book = Book.objects.get(title='Book 1')
+        response = self.client.get(reverse('books:api_book_detail', args=[book.pk]),
+                                   {'fields': 'title,category_name,download_url'})
+        self.assertEqual(response.json(), {'title': 'Book 1', 'category_name': 'Fiction', 'download_url': None})
+        response = self.client.get(reverse('books:api_book_detail', args=[book.pk]),
+                                   {'fields': 'title,category_name,download_url'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        data = self.client.get(reverse('books:api_book_list'), {'fields': 'title,image', 'ordering': 'newest',
+                                                                'per_page': 2}).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertTrue(data['results'][0]['image'].endswith('cover-photo.png'))
+        self.assertEqual(self.client.get(reverse('books:api_book_list'), {'fields': 'title,password'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('books:api_book_list'), {'cursor': 'junk'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('books:api_book_detail', args=[0])).status_code, 404)
+
+    def test_categories(self):
+        data = self.client.get(reverse('books:api_category_list')).json()
+        self.assertEqual(data['results'], [{'id': self.category.pk, 'name': 'Fiction', 'book_count': 5}])
+        data = self.client.get(reverse('books:api_sub_category_list'), {'category': self.category.pk,
+                                                                        'fields': 'name'}).json()
+        self.assertEqual(data['results'], [{'name': 'Fantasy'}])
+
+
+class AutocompleteTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.invalidate()
+        self.category = Category.objects.create(name='Fiction')
+        self.rings = self.create('The Lord of the Rings', 'J. R. R. Tolkien', views=50)
+        self.create('Lord Jim', 'Joseph Conrad', views=10)
+        self.create('Lorna Doone', 'R. D. Blackmore', views=5)
+
+    def create(self, title, author, views=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title=title, author=author, description='Text', year=2000, pages=10,
+                                       category=self.category)
+        Book.objects.filter(pk=book.pk).update(views_count=views)
+        return book
+
+    def complete(self, q, **params):
+        response = self.client.get(reverse('books:autocomplete'), {'q': q, **params})
+        return [result['text'] for result in response.json()['results']]
+
+    def test_completions_are_ranked_by_popularity(self):
+        autocomplete_index.invalidate()
+        self.assertEqual(self.complete('lor'), ['The Lord of the Rings', 'Lord Jim', 'Lorna Doone'])
+        self.assertEqual(self.complete('lor', limit=1), ['The Lord of the Rings'])
+        self.assertEqual(self.complete('tolk'), ['J. R. R. Tolkien'])
+        self.assertEqual(self.complete('j', kind='author'), [])
+        self.assertEqual(self.complete('jo', kind='author'), ['Joseph Conrad'])
+
+    def test_index_follows_saves_and_deletes(self):
+        autocomplete_index.invalidate()
+        self.assertEqual(self.complete('lord', kind='title'), ['The Lord of the Rings', 'Lord Jim'])
+        with self.assertNumQueries(0):
+            self.complete('lord', kind='title')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rings.title = 'The Hobbit'
+            self.rings.save()
+        self.assertEqual(self.complete('lord', kind='title'), ['Lord Jim'])
+        self.assertEqual(self.complete('hob'), ['The Hobbit'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rings.delete()
+        self.assertEqual(self.complete('hob'), [])
+        self.assertEqual(self.complete('tolk'), [])
+
+    @override_settings(BOOK_GENERATION_CACHE=False, BOOK_LOCAL_CACHE_TIMEOUT=30)
+    def test_index_is_rebuilt_often_without_a_shared_cache(self):
+        self.assertEqual(self.complete('lorn'), ['Lorna Doone'])
+        # A save in another worker does not reach this worker's change log.
+        Book.objects.filter(title='Lorna Doone').update(title='Lorna')
+        self.assertEqual(self.complete('lorn'), ['Lorna Doone'])
+        autocomplete_index._built_at -= 31
+        self.assertEqual(self.complete('lorn'), ['Lorna'])
+
+    def test_stale_index_is_served_while_rebuilding(self):
+        self.assertEqual(self.complete('lorn'), ['Lorna Doone'])
+        Book.objects.filter(title='Lorna Doone').update(title='Lorna')
+        autocomplete_index.invalidate()
+        with (self.settings(BOOK_AUTOCOMPLETE_BACKGROUND=True), mock.patch('books.autocomplete.threading.Thread') as thread,
+              self.assertNumQueries(0)):
+            self.assertEqual(self.complete('lorn'), ['Lorna Doone'])
+            self.assertEqual(self.complete('lorn'), ['Lorna Doone'])
+        thread.assert_called_once()
+        autocomplete_index._rebuild(*thread.call_args.kwargs['args'])
+        self.assertEqual(self.complete('lorn'), ['Lorna'])
+
+
+class Isbn13Test(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.war = create_book(self.category, title='War and Peace', author='Leo Tolstoy', isbn='978-0-14-044793-4')
+
+    def test_to_isbn13(self):
+        self.assertEqual(to_isbn13('0-14-044793-8'), '9780140447934')
+        self.assertEqual(to_isbn13('ISBN 080442957X'), '9780804429573')
+        self.assertIsNone(to_isbn13('0140447939'))
+        self.assertIsNone(to_isbn13('978014'))
+
+    def test_isbn_like_queries_use_an_exact_lookup(self):
+        self.assertEqual(self.war.isbn13, '9780140447934')
+        for params in ({'isbn': '0-14-044793-8'}, {'q': '0140447938'}, {'q': '978 0 14 044793 4'}):
+            with self.subTest(**params):
+                spec = CatalogueFilter.from_query_params(params)
+                self.assertEqual(spec.q, '')
+                queryset = get_catalogue_queryset(spec)
+                self.assertIn('isbn13', str(queryset.query))
+                self.assertEqual(list(queryset), [self.war])
+        self.assertEqual(list(get_catalogue_queryset(CatalogueFilter(isbn='04479'))), [self.war])
+
+    def test_same_edition_cannot_be_added_twice(self):
+        form = BookForm(data={'title': 'Copy', 'description': 'x', 'author': 'Tolstoy', 'year': 1869, 'pages': 1,
+                              'category': self.category.pk, 'isbn': '0140447938'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('isbn', form.errors)
+
+    def test_isbn_migration_reports_duplicates(self):
+        migration = import_module('books.migrations.0017_normalize_book_isbn')
+        copy = create_book(self.category, title='War and Peace (copy)')
+        Book.objects.filter(pk=copy.pk).update(isbn='978 0 14 044793 4')
+        with self.assertRaisesMessage(RuntimeError, f'9780140447934: books {self.war.pk}, {copy.pk}'):
+            migration.normalize_isbns(apps, None)
+        copy.refresh_from_db()
+        self.assertEqual(copy.isbn, '978 0 14 044793 4')
+        Book.objects.filter(pk=copy.pk).update(isbn='0 14 044793 8')
+        migration.normalize_isbns(apps, None)
+        copy.refresh_from_db()
+        self.assertEqual(copy.isbn, '0140447938')
+
+    def test_isbn13_migration_reports_duplicates(self):
+        migration = import_module('books.migrations.0018_book_isbn13')
+        copy = create_book(self.category, title='War and Peace (copy)')
+        Book.objects.filter(pk=copy.pk).update(isbn='0140447938')
+        with self.assertRaisesMessage(RuntimeError, f'9780140447934: books {self.war.pk}, {copy.pk}'):
+            migration.backfill_isbn13(apps, None)
+        copy.refresh_from_db()
+        self.assertEqual(copy.isbn, '0140447938')
+        self.assertIsNone(copy.isbn13)
+
+    def test_import_matches_isbn10_to_stored_isbn13(self):
+        path = os.path.join(tempfile.mkdtemp(), 'books.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('title,author,year,pages,isbn,category\nWar and Peace (2nd ed.),Tolstoy,1869,1225,0140447938,Fiction\n')
+        call_command('import_books', path, stdout=StringIO(), stderr=StringIO())
+        self.war.refresh_from_db()
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(self.war.title, 'War and Peace (2nd ed.)')
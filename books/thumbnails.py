@@ -0,0 +1,66 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (240, 480, 960)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_name(name, width, fmt='jpeg'):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_w{width}.{THUMBNAIL_FORMATS[fmt][1]}'
+
+
+def thumbnail_names(name):
+    return [thumbnail_name(name, width, fmt) for width in THUMBNAIL_WIDTHS for fmt in THUMBNAIL_FORMATS]
+
+
+def has_thumbnails(name, storage=default_storage):
+    return all(storage.exists(thumb) for thumb in thumbnail_names(name))
+
+
+def load_image(name, storage):
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_thumbnails(name, storage=default_storage, force=False):
+    if not name or not storage.exists(name) or (not force and has_thumbnails(name, storage)):
+        return []
+    try:
+        image = load_image(name, storage)
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Cannot create thumbnails for %s', name, exc_info=True)
+        return []
+
+    created = []
+    for width in THUMBNAIL_WIDTHS:
+        resized = image.copy()
+        if resized.width > width:
+            resized.thumbnail((width, resized.height), Image.LANCZOS)
+        for fmt, (pil_format, _) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, quality=THUMBNAIL_QUALITY)
+            target = thumbnail_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            created.append(storage.save(target, ContentFile(buffer.getvalue())))
+    return created
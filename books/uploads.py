@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from books.models import Upload
+from books.storage import book_storage
+from books.stored_files import acquire_file, release_file
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+UPLOAD_DIRECTORY = 'uploads/'
+READ_SIZE = 64 * 1024
+
+# Running SHA-256 state per upload, so a chunk only hashes its own bytes.
+# Chunks that land on another process rebuild it from the partial file.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f'Upload continues at byte {offset}')
+        self.offset = offset
+
+
+def parse_content_range(header):
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    start, end, total = (int(value) for value in match.groups())
+    if start > end or end >= total:
+        return None
+    return start, end, total
+
+
+def upload_status(upload):
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'complete': upload.is_complete,
+        'sha256': upload.sha256,
+    }
+
+
+def create_upload(filename, size, user=None):
+    filename = get_valid_filename(os.path.basename(filename or ''))
+    if not filename:
+        raise ValueError('A file name is required')
+    if size <= 0 or size > settings.BOOK_UPLOAD_MAX_SIZE:
+        raise ValueError(f'Uploads must be between 1 and {settings.BOOK_UPLOAD_MAX_SIZE} bytes')
+    # Chunks go to a private file that is moved under its content hash once
+    # the upload is complete.
+    path = default_storage.save(UPLOAD_DIRECTORY + filename, ContentFile(b''))
+    return Upload.objects.create(user=user, filename=filename, path=path, size=size)
+
+
+def get_hasher(upload):
+    with _hashers_lock:
+        offset, hasher = _hashers.pop(upload.pk, (None, None))
+    if offset == upload.offset:
+        return hasher
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    with default_storage.open(upload.path, 'rb') as f:
+        while remaining:
+            data = f.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def write_chunk(upload_id, start, length, total, stream, user=None):
+    uploads = Upload.objects.select_for_update()
+    if user is not None:
+        uploads = uploads.filter(user=user)
+    with transaction.atomic():
+        upload = uploads.get(pk=upload_id)
+        if total != upload.size:
+            raise ValueError(f'The upload is {upload.size} bytes, not {total}')
+        if upload.is_complete or start != upload.offset:
+            raise UploadOffsetMismatch(upload.offset)
+        if start + length > upload.size:
+            raise ValueError('The chunk runs past the end of the upload')
+
+        hasher = get_hasher(upload)
+        written = 0
+        with open(default_storage.path(upload.path), 'r+b') as f:
+            # Drop whatever an interrupted request left behind the offset.
+            f.seek(start)
+            f.truncate()
+            while written < length:
+                try:
+                    data = stream.read(min(READ_SIZE, length - written))
+                except OSError:
+                    break
+                if not data:
+                    break
+                f.write(data)
+                hasher.update(data)
+                written += len(data)
+
+        # A dropped connection keeps the bytes that made it, the client
+        # resumes from the new offset.
+        upload.offset = start + written
+        if upload.offset == upload.size:
+            upload.sha256 = hasher.hexdigest()
+            upload.path = book_storage.adopt(upload.path, upload.sha256)
+            upload.completed_at = timezone.now()
+            # Keeps the content alive if it is shared with a book that gets
+            # deleted before this upload is attached.
+            acquire_file(upload.path)
+        else:
+            with _hashers_lock:
+                _hashers[upload.pk] = (upload.offset, hasher)
+        upload.save(update_fields=['offset', 'sha256', 'path', 'completed_at'])
+    return upload
+
+
+def delete_stale_uploads(older_than):
+    # Uploads still here were never attached to a book, so their files or
+    # file references go too.
+    deleted = 0
+    for upload in Upload.objects.filter(created_at__lt=older_than).iterator():
+        with _hashers_lock:
+            _hashers.pop(upload.pk, None)
+        if upload.is_complete:
+            release_file(upload.path)
+        else:
+            default_storage.delete(upload.path)
+        upload.delete()
+        deleted += 1
+    return deleted
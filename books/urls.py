@@ -1,11 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from books.views import (BookListView, BookCreateView, BookUpdateView, BookDeleteView, BookDetailView,
+from books.views import (ApiBookDetailView, ApiBookListView, ApiCategoryListView, ApiSubCategoryListView,
+                         AsyncBookListView, AutocompleteView, AsyncCategoryBookListView, AsyncBookDetailView,
+                         BookListView, BookCreateView, BookUpdateView, BookDeleteView, BookDetailView,
                          CategoryBookListView, OrderBookView, SendBookView, OrderedBookView, SendedBookView,
-                         OrderedBookDetailView, SendedBookDetailView
+                         OrderedBookDetailView, SendedBookDetailView, PromoteSendBookView, DownloadBookView,
+                         ExportView, PerformanceReportView, UploadChunkView, UploadCreateView
                          )
 
 app_name = 'books'
 
+if settings.BOOK_ASYNC_VIEWS:
+    BookListView, CategoryBookListView, BookDetailView = (
+        AsyncBookListView, AsyncCategoryBookListView, AsyncBookDetailView
+    )
+
 urlpatterns = [
     path('', BookListView.as_view(), name='book_list'),
     path('create/', BookCreateView.as_view(), name='book_create'),
@@ -15,8 +24,19 @@ urlpatterns = [
     path('sended/', SendedBookView.as_view(), name='book_sended'),
     path('ordered/<int:pk>', OrderedBookDetailView.as_view(), name='book_ordered_detail'),
     path('sended/<int:pk>', SendedBookDetailView.as_view(), name='book_sended_detail'),
+    path('sended/<int:pk>/promote/', PromoteSendBookView.as_view(), name='book_sended_promote'),
     path('<int:pk>/', BookDetailView.as_view(), name='book_detail'),
     path('<int:pk>/update/', BookUpdateView.as_view(), name='book_update'),
     path('<int:pk>/delete/', BookDeleteView.as_view(), name='book_delete'),
+    path('<int:pk>/download/', DownloadBookView.as_view(), name='book_download'),
+    path('uploads/', UploadCreateView.as_view(), name='upload_create'),
+    path('uploads/<uuid:pk>/', UploadChunkView.as_view(), name='upload_chunk'),
+    path('export/<str:dataset>/', ExportView.as_view(), name='export'),
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
+    path('api/books/', ApiBookListView.as_view(), name='api_book_list'),
+    path('api/books/<int:pk>/', ApiBookDetailView.as_view(), name='api_book_detail'),
+    path('api/categories/', ApiCategoryListView.as_view(), name='api_category_list'),
+    path('api/sub-categories/', ApiSubCategoryListView.as_view(), name='api_sub_category_list'),
+    path('performance/', PerformanceReportView.as_view(), name='performance_report'),
     path('category/<int:category_id>/', CategoryBookListView.as_view(), name='category_book_list'),
 ]
\ No newline at end of file
@@ -1,137 +1,192 @@
-from urllib.parse import urlencode
+import asyncio
+import hashlib
 
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count
-from django.http import Http404, FileResponse
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.paginator import EmptyPage, PageNotAnInteger
 from django.shortcuts import redirect, get_object_or_404
+from django.utils.cache import patch_cache_control
 from django.views import View
-from .models import Book, Category, BookDownloaded, BookShowed, OrderBook, SendBook
+from .api import (BOOK_COMPUTED_FIELDS, BOOK_FIELDS, CATEGORY_FIELDS, DEFAULT_BOOK_FIELDS, SUB_CATEGORY_FIELDS,
+                  BookSerializer, get_sub_categories, parse_fields, parse_page_size, serialize_categories)
+from .autocomplete import DEFAULT_LIMIT, KINDS, MAX_LIMIT, autocomplete_index
+from .buffers import book_showed_buffer
+from .cache import acached, aget_version, cached, get_version
+from .conditional import (BOOK_GENERATIONS, CATALOGUE_GENERATIONS, book_etag, catalogue_etag,
+                          has_pending_messages, make_etag, not_modified, set_validators)
+from .exporter import DATASETS, FORMATS, export_filename, export_stream, parse_date
+from .downloads import attachment_name, file_download_response, is_resumed_download
+from .middleware import get_worst_requests
+from .catalogue import (CatalogueFilter, apaginate_catalogue, get_catalogue_queryset, normalize_query_params,
+                        paginate_catalogue, parse_int)
+from .pagination import CursorPaginator
+from .sidebar import aget_category_sidebar, get_category_sidebar
+from .models import Book, BookDownloaded, OrderBook, SendBook, Upload
 from .forms import BookForm, OrderBookForm, SendBookForm
+from .uploads import UploadOffsetMismatch, create_upload, parse_content_range, upload_status, write_chunk
 from django.shortcuts import render
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+
+
+def latest_books_queryset():
+    return Book.objects.filter(created_at__isnull=False).order_by('-created_at', '-id').values('id', 'title')[:10]
 
 
 def get_latest_books():
-    latest_books = Book.objects.order_by('-created_at')[:10]
-    return latest_books
+    return cached('latest_books', lambda: list(latest_books_queryset()))
 
 
-class BookListView(View):
-    def get(self, request):
-        categories = Category.objects.all()
-        book_list = Book.objects.annotate(showed_count=Count('bookshowed')).order_by('-showed_count')
-
-        query_params = request.GET
-        latest_books = get_latest_books()
-        title = query_params.get('title', None)
-        author = query_params.get('author', None)
-        year = query_params.get('year', None)
-        isbn = query_params.get('isbn', None)
-
-        if title:
-            book_list = book_list.filter(title__icontains=title)
-        if author:
-            book_list = book_list.filter(author__icontains=author)
-        if year:
-            book_list = book_list.filter(year=year)
-        if isbn:
-            book_list = book_list.filter(isbn__icontains=isbn)
-
-        paginator = Paginator(book_list, 6)
-
-        page = request.GET.get('page')
-        try:
-            all_books = paginator.page(page)
-        except PageNotAnInteger:
+async def aget_latest_books():
+    async def build():
+        return [row async for row in latest_books_queryset()]
+    return await acached('latest_books', build)
 
-            all_books = paginator.page(1)
-        except EmptyPage:
-            all_books = paginator.page(paginator.num_pages)
 
-        query_params = query_params.dict()
-        if 'page' in query_params:
-            del query_params['page']
-        encoded_query_params = urlencode(query_params)
-        context = {
-            'all_books': all_books,
-            'query_params': encoded_query_params,
-            'categories': categories,
-            'last_books': latest_books
-        }
-        return render(request, 'books/book_list.html', context)
+def is_page_cacheable(request):
+    return not request.user.is_authenticated and not has_pending_messages(request)
 
 
-class CategoryBookListView(View):
-    def get(self, request, category_id):
-        categories = Category.objects.all()
-        book_list = Book.objects.annotate(showed_count=Count('bookshowed')).order_by('-showed_count').filter(category_id=category_id)
+def page_cache_key(request):
+    query = f"{request.path}?{normalize_query_params(request.GET)}&cursor={request.GET.get('cursor', '')}"
+    return 'page:' + hashlib.md5(query.encode()).hexdigest()
 
-        query_params = request.GET
 
-        title = query_params.get('title', None)
-        author = query_params.get('author', None)
-        year = query_params.get('year', None)
-        isbn = query_params.get('isbn', None)
-        latest_books = get_latest_books()
-        if title:
-            book_list = book_list.filter(title__icontains=title)
-        if author:
-            book_list = book_list.filter(author__icontains=author)
-        if year:
-            book_list = book_list.filter(year=year)
-        if isbn:
-            book_list = book_list.filter(isbn__icontains=isbn)
+class BookListView(View):
+    def get_filter(self, request, **kwargs):
+        return CatalogueFilter.from_query_params(request.GET)
+
+    def get(self, request, **kwargs):
+        spec = self.get_filter(request, **kwargs)
+        cursor = request.GET.get('cursor')
+        etag = None
+        if not has_pending_messages(request):
+            etag = catalogue_etag(spec, cursor, request.user.pk, get_version(*CATALOGUE_GENERATIONS))
+        response = not_modified(request, etag)
+        if response is not None:
+            return set_validators(response, etag)
+        if is_page_cacheable(request):
+            content = cached(page_cache_key(request), lambda: self.render_page(request, spec, cursor).content,
+                             generations=CATALOGUE_GENERATIONS, timeout=settings.BOOK_PAGE_CACHE_TIMEOUT)
+            response = HttpResponse(content)
+        else:
+            response = self.render_page(request, spec, cursor)
+        return set_validators(response, etag)
+
+    def render_page(self, request, spec, cursor):
+        # The sidebar helpers are passed uncalled so a cached fragment in
+        # base_book.html never has to run them.
+        context = {
+            'all_books': paginate_catalogue(spec, cursor),
+            'query_params': normalize_query_params(request.GET),
+            'categories': get_category_sidebar,
+            'last_books': get_latest_books
+        }
+        return render(request, 'books/book_list.html', context)
 
-        paginator = Paginator(book_list, 6)
 
-        page = request.GET.get('page')
-        try:
-            all_books = paginator.page(page)
-        except PageNotAnInteger:
+class CategoryBookListView(BookListView):
+    def get_filter(self, request, category_id):
+        return CatalogueFilter.from_query_params(request.GET, category_id=category_id)
 
-            all_books = paginator.page(1)
-        except EmptyPage:
-            all_books = paginator.page(paginator.num_pages)
 
-        query_params = query_params.dict()
-        if 'page' in query_params:
-            del query_params['page']
-        encoded_query_params = urlencode(query_params)
+class BookDetailView(View):
+    def get(self, request, pk):
+        book = get_object_or_404(Book, pk=pk)
+        user = request.user
+        if user.is_authenticated:
+            book_showed_buffer.add(book.pk, user.pk)
+        etag = None if has_pending_messages(request) else book_etag(book, user.pk, get_version(*BOOK_GENERATIONS))
+        response = not_modified(request, etag, book.updated_at)
+        if response is not None:
+            return set_validators(response, etag, book.updated_at)
+        context = {
+            'book': book,
+            'categories': get_category_sidebar,
+            'last_books': get_latest_books
+        }
+        return set_validators(render(request, 'books/book_detail.html', context), etag, book.updated_at)
+
+
+class AsyncBookListView(View):
+    def get_filter(self, request, **kwargs):
+        return CatalogueFilter.from_query_params(request.GET)
+
+    async def get(self, request, **kwargs):
+        spec = self.get_filter(request, **kwargs)
+        cursor = request.GET.get('cursor')
+        user_id, pending = await sync_to_async(lambda: (request.user.pk, has_pending_messages(request)))()
+        etag = None
+        if not pending:
+            etag = catalogue_etag(spec, cursor, user_id, await aget_version(*CATALOGUE_GENERATIONS))
+        response = not_modified(request, etag)
+        if response is not None:
+            return set_validators(response, etag)
+        if not pending and user_id is None:
+            async def build():
+                return (await self.render_page(request, spec, cursor)).content
+            content = await acached(page_cache_key(request), build, generations=CATALOGUE_GENERATIONS,
+                                    timeout=settings.BOOK_PAGE_CACHE_TIMEOUT)
+            response = HttpResponse(content)
+        else:
+            response = await self.render_page(request, spec, cursor)
+        return set_validators(response, etag)
+
+    async def render_page(self, request, spec, cursor):
+        all_books, categories, latest_books = await asyncio.gather(
+            apaginate_catalogue(spec, cursor),
+            aget_category_sidebar(),
+            aget_latest_books(),
+        )
         context = {
             'all_books': all_books,
-            'query_params': encoded_query_params,
+            'query_params': normalize_query_params(request.GET),
             'categories': categories,
             'last_books': latest_books
         }
-        return render(request, 'books/book_list.html', context)
+        return await sync_to_async(render)(request, 'books/book_list.html', context)
 
 
-class BookDetailView(View):
-    def get(self, request, pk):
+class AsyncCategoryBookListView(AsyncBookListView):
+    def get_filter(self, request, category_id):
+        return CatalogueFilter.from_query_params(request.GET, category_id=category_id)
 
-        categories = Category.objects.all()
-        book = get_object_or_404(Book, pk=pk)
-        user = request.user
-        if user.is_authenticated:
-            BookShowed.objects.create(book=book, user=user)
-        latest_books = get_latest_books()
+
+class AsyncBookDetailView(View):
+    async def get(self, request, pk):
+        try:
+            book = await Book.objects.aget(pk=pk)
+        except Book.DoesNotExist:
+            raise Http404('No Book matches the given query.')
+        user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+        if user is not None:
+            await sync_to_async(book_showed_buffer.add)(book.pk, user.pk)
+        etag = None
+        if not await sync_to_async(has_pending_messages)(request):
+            etag = book_etag(book, user.pk if user else None, await aget_version(*BOOK_GENERATIONS))
+        response = not_modified(request, etag, book.updated_at)
+        if response is not None:
+            return set_validators(response, etag, book.updated_at)
+        categories, latest_books = await asyncio.gather(aget_category_sidebar(), aget_latest_books())
         context = {
             'book': book,
             'categories': categories,
             'last_books': latest_books
         }
-        return render(request, 'books/book_detail.html', context)
+        response = await sync_to_async(render)(request, 'books/book_detail.html', context)
+        return set_validators(response, etag, book.updated_at)
 
 
 class BookCreateView(View):
     def get(self, request):
 
-        form = BookForm()
+        form = BookForm(user=request.user)
         return render(request, 'books/book_form.html', {'form': form})
 
     def post(self, request):
-        form = BookForm(request.POST, request.FILES)
+        form = BookForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             form.save()
             return redirect('books:book_list')
@@ -141,12 +196,12 @@ class BookCreateView(View):
 class BookUpdateView(View):
     def get(self, request, pk):
         book = get_object_or_404(Book, pk=pk)
-        form = BookForm(instance=book)
+        form = BookForm(instance=book, user=request.user)
         return render(request, 'books/book_form.html', {'form': form, 'book': book})
 
     def post(self, request, pk):
         book = get_object_or_404(Book, pk=pk)
-        form = BookForm(request.POST, request.FILES, instance=book)
+        form = BookForm(request.POST, request.FILES, instance=book, user=request.user)
         if form.is_valid():
             form.save()
             return redirect('books:book_list')
@@ -168,13 +223,11 @@ class DownloadBookView(LoginRequiredMixin, View):
     def get(self, request, pk):
         book = get_object_or_404(Book, pk=pk)
         user = request.user
-        if not book.file:
+        if not book.file or not book.file.storage.exists(book.file.name):
             raise Http404("Book file not found.")
-        BookDownloaded.objects.create(user=user, book=book)
-        response = FileResponse(book.file.open('rb'), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{book.file.name}"'
-
-        return response
+        if not is_resumed_download(request):
+            BookDownloaded.objects.get_or_create(user=user, book=book)
+        return file_download_response(request, book.file, attachment_name(book.file, book.title))
 
 
 class OrderBookView(LoginRequiredMixin, View):
@@ -195,11 +248,11 @@ class OrderBookView(LoginRequiredMixin, View):
 
 class SendBookView(LoginRequiredMixin, View):
     def get(self, request):
-        form = SendBookForm()
+        form = SendBookForm(user=request.user)
         return render(request, 'books/send_book.html', {'form': form})
 
     def post(self, request):
-        form = OrderBookForm(request.POST)
+        form = SendBookForm(request.POST, user=request.user)
         if form.is_valid():
             book = form.save(commit=False)
             book.user = request.user
@@ -227,7 +280,192 @@ class SendedBookDetailView(LoginRequiredMixin, View):
         return render(request, 'books/sended_book_detail.html', {'book':book})
     
 
+class PromoteSendBookView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.can_add_book()
+
+    def get(self, request, pk):
+        send_book = get_object_or_404(SendBook, pk=pk)
+        form = BookForm(initial={
+            'title': send_book.book_name,
+            'description': send_book.description,
+            'author': send_book.author,
+            'url': send_book.url,
+        }, user=request.user)
+        return render(request, 'books/book_form.html', {'form': form, 'send_book': send_book})
+
+    def post(self, request, pk):
+        send_book = get_object_or_404(SendBook, pk=pk)
+        form = BookForm(request.POST, user=request.user)
+        if form.is_valid():
+            book = form.save(commit=False)
+            if not book.file and send_book.file:
+                # Both rows point at the same content-addressed file, only
+                # its reference count changes.
+                book.file.name = send_book.file.name
+                book.size = send_book.file.size
+            book.save()
+            form.save_m2m()
+            send_book.status = True
+            send_book.save(update_fields=['status'])
+            return redirect('books:book_detail', pk=book.pk)
+        return render(request, 'books/book_form.html', {'form': form, 'send_book': send_book})
+
+
 class OrderedBookDetailView(LoginRequiredMixin, View):
     def get(self, request, pk):
         book = OrderBook.objects.get(pk=pk)
         return render(request, 'books/ordered_book_detail.html', {'book':book})
+
+
+class UploadCreateView(LoginRequiredMixin, View):
+    def post(self, request):
+        try:
+            size = int(request.POST.get('size', ''))
+            upload = create_upload(request.POST.get('filename'), size, request.user)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(upload_status(upload), status=201)
+
+
+class UploadChunkView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk, user=request.user)
+        return JsonResponse(upload_status(upload))
+
+    def put(self, request, pk):
+        content_range = parse_content_range(request.headers.get('Content-Range'))
+        if content_range is None:
+            return JsonResponse({'error': 'A Content-Range header is required'}, status=400)
+        start, end, total = content_range
+        length = end - start + 1
+        if length > settings.BOOK_UPLOAD_CHUNK_SIZE:
+            return JsonResponse({'error': f'Chunks are limited to {settings.BOOK_UPLOAD_CHUNK_SIZE} bytes'},
+                                status=413)
+        try:
+            upload = write_chunk(pk, start, length, total, request, user=request.user)
+        except Upload.DoesNotExist:
+            raise Http404('No Upload matches the given query.')
+        except UploadOffsetMismatch as e:
+            return JsonResponse({'error': str(e), 'offset': e.offset}, status=409)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(upload_status(upload))
+
+
+class ExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_superuser or self.request.user.can_add_book()
+
+    def get(self, request, dataset):
+        if dataset not in DATASETS:
+            raise Http404('Unknown export.')
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in FORMATS:
+            return HttpResponseBadRequest(f'Unknown format "{fmt}"')
+        compress = request.GET.get('gzip') in ('1', 'true')
+        try:
+            since = parse_date(request.GET.get('from'))
+            until = parse_date(request.GET.get('to'))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        response = StreamingHttpResponse(export_stream(dataset, fmt, compress, since, until),
+                                         content_type='application/gzip' if compress else FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(dataset, fmt, compress)}"'
+        return response
+
+
+class AutocompleteView(View):
+    def get(self, request):
+        kind = request.GET.get('kind')
+        limit = parse_int(request.GET.get('limit')) or DEFAULT_LIMIT
+        results = autocomplete_index.complete(request.GET.get('q', ''), kind if kind in KINDS else None,
+                                              min(max(limit, 1), MAX_LIMIT))
+        response = JsonResponse({'results': results})
+        # Completions are the same for everyone; let browsers reuse them
+        # while the user retypes.
+        patch_cache_control(response, public=True, max_age=60)
+        return response
+
+
+class ApiView(View):
+    generations = CATALOGUE_GENERATIONS
+
+    def get(self, request, **kwargs):
+        try:
+            fields = parse_fields(request.GET.get('fields'), self.available_fields, self.default_fields)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        etag = None
+        if not has_pending_messages(request):
+            etag = make_etag(self.__class__.__name__, kwargs, fields, normalize_query_params(request.GET),
+                             request.GET.get('cursor'), request.GET.get('per_page'), get_version(*self.generations))
+        response = not_modified(request, etag)
+        if response is not None:
+            return set_validators(response, etag)
+        return set_validators(self.get_data(request, fields, **kwargs), etag)
+
+
+class ApiBookListView(ApiView):
+    available_fields = {**BOOK_FIELDS, **BOOK_COMPUTED_FIELDS}
+    default_fields = DEFAULT_BOOK_FIELDS
+
+    def get_data(self, request, fields):
+        spec = CatalogueFilter.from_query_params(request.GET)
+        serializer = BookSerializer(fields)
+        queryset = serializer.prepare(get_catalogue_queryset(spec), [name.lstrip('-') for name in spec.order_by])
+        paginator = CursorPaginator(queryset, parse_page_size(request.GET.get('per_page')), ordering=spec.order_by)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except PageNotAnInteger as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except EmptyPage:
+            return JsonResponse({'results': [], 'next': None, 'previous': None})
+        return JsonResponse({
+            'results': [serializer.serialize(obj) for obj in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+
+class ApiBookDetailView(ApiView):
+    available_fields = {**BOOK_FIELDS, **BOOK_COMPUTED_FIELDS}
+    default_fields = DEFAULT_BOOK_FIELDS
+
+    def get_data(self, request, fields, pk):
+        serializer = BookSerializer(fields)
+        obj = serializer.prepare(Book.objects.filter(pk=pk)).first()
+        if obj is None:
+            return JsonResponse({'error': 'No Book matches the given query.'}, status=404)
+        return JsonResponse(serializer.serialize(obj))
+
+
+class ApiCategoryListView(ApiView):
+    generations = BOOK_GENERATIONS
+    available_fields = CATEGORY_FIELDS
+    default_fields = CATEGORY_FIELDS
+
+    def get_data(self, request, fields):
+        return JsonResponse({'results': serialize_categories(get_category_sidebar(), fields)})
+
+
+class ApiSubCategoryListView(ApiView):
+    generations = ('categories',)
+    available_fields = SUB_CATEGORY_FIELDS
+    default_fields = tuple(SUB_CATEGORY_FIELDS)
+
+    def get_data(self, request, fields):
+        category_id = parse_int(request.GET.get('category'))
+        return JsonResponse({'results': get_sub_categories(fields, category_id)})
+
+
+class PerformanceReportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def get(self, request):
+        from books.urls import app_name, urlpatterns
+
+        url_names = [f'{app_name}:{pattern.name}' for pattern in urlpatterns if pattern.name]
+        reports = [(name, worst) for name, worst in get_worst_requests(url_names).items() if worst]
+        return render(request, 'books/performance_report.html', {'reports': reports})
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # packages
     'crispy_forms',
     "crispy_bootstrap5",
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'books.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,42 @@ DATABASES = {
 }
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Users and sessions are only cached when the cache is shared, a per-process
+# cache would keep serving a stale user or session after another worker
+# changes it.
+if REDIS_URL:
+    AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+else:
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+ACCOUNTS_USER_CACHE_TIMEOUT = config('ACCOUNTS_USER_CACHE_TIMEOUT', default=300, cast=int)
+
+# Sessions are read from the cache and only written through to the database.
+# Set SESSION_ENGINE=django.contrib.sessions.backends.cache to keep them in
+# Redis alone.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db'
+                        if REDIS_URL else 'django.contrib.sessions.backends.db')
+
+# Generation-versioned caching (fragments, cached pages, ETags) needs every
+# worker to see a bump. Without a shared cache each worker caches on its own
+# and entries live at most BOOK_LOCAL_CACHE_TIMEOUT seconds.
+BOOK_GENERATION_CACHE = config('BOOK_GENERATION_CACHE', default=bool(REDIS_URL), cast=bool)
+BOOK_LOCAL_CACHE_TIMEOUT = config('BOOK_LOCAL_CACHE_TIMEOUT', default=30, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -141,6 +179,37 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# '' streams downloads through Django, 'nginx' answers with X-Accel-Redirect
+# and 'apache' with X-Sendfile so the front proxy sends the bytes.
+BOOK_DOWNLOAD_OFFLOAD = config('BOOK_DOWNLOAD_OFFLOAD', default='')
+BOOK_DOWNLOAD_ACCEL_PREFIX = config('BOOK_DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+
+PERFORMANCE_LOG_SAMPLE_RATE = config('PERFORMANCE_LOG_SAMPLE_RATE', default=0.01, cast=float)
+PERFORMANCE_SLOWEST_STATEMENTS = 5
+PERFORMANCE_WORST_REQUESTS = 20
+
+# Eager mode runs books.tasks inline instead of queueing them for run_jobs.
+BOOK_JOBS_EAGER = config('BOOK_JOBS_EAGER', default=False, cast=bool)
+BOOK_JOBS_RETRY_DELAY = config('BOOK_JOBS_RETRY_DELAY', default=10, cast=int)
+
+BOOK_VIEW_BUFFER_SIZE = config('BOOK_VIEW_BUFFER_SIZE', default=100, cast=int)
+BOOK_VIEW_BUFFER_INTERVAL = config('BOOK_VIEW_BUFFER_INTERVAL', default=5, cast=int)
+# Events kept for a retry while flushes fail.
+BOOK_VIEW_BUFFER_MAX_PENDING = config('BOOK_VIEW_BUFFER_MAX_PENDING', default=10000, cast=int)
+# Flush from a background thread per process instead of the request that fills the buffer.
+BOOK_VIEW_BUFFER_BACKGROUND = config('BOOK_VIEW_BUFFER_BACKGROUND', default=True, cast=bool)
+
+BOOK_UPLOAD_CHUNK_SIZE = config('BOOK_UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+BOOK_UPLOAD_MAX_SIZE = config('BOOK_UPLOAD_MAX_SIZE', default=1024 * 1024 * 1024, cast=int)
+
+BOOK_PAGE_CACHE_TIMEOUT = config('BOOK_PAGE_CACHE_TIMEOUT', default=300, cast=int)
+
+BOOK_AUTOCOMPLETE_MAX_AGE = config('BOOK_AUTOCOMPLETE_MAX_AGE', default=3600, cast=int)
+# Rebuild a stale index in a background thread per process while requests use the old one.
+BOOK_AUTOCOMPLETE_BACKGROUND = config('BOOK_AUTOCOMPLETE_BACKGROUND', default=True, cast=bool)
+
+BOOK_ASYNC_VIEWS = config('BOOK_ASYNC_VIEWS', default=False, cast=bool)
+
 TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = config('TELEGRAM_CHAT_ID')
 CSRF_COOKIE_HTTPONLY = True
@@ -0,0 +1,49 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const inputs = document.querySelectorAll('input[data-autocomplete-url]');
+    const delay = 150;
+
+    inputs.forEach(function(input) {
+        const list = document.createElement('datalist');
+        list.id = input.name + '-completions';
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        let timer = null;
+        let controller = null;
+
+        async function complete() {
+            const q = input.value.trim();
+            if (q.length < 2) {
+                list.replaceChildren();
+                return;
+            }
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            const params = new URLSearchParams({q: q});
+            if (input.dataset.autocompleteKind) {
+                params.set('kind', input.dataset.autocompleteKind);
+            }
+            try {
+                const response = await fetch(input.dataset.autocompleteUrl + '?' + params, {signal: controller.signal});
+                const data = await response.json();
+                list.replaceChildren(...data.results.map(function(result) {
+                    const option = document.createElement('option');
+                    option.value = result.text;
+                    return option;
+                }));
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    list.replaceChildren();
+                }
+            }
+        }
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            timer = setTimeout(complete, delay);
+        });
+    });
+});
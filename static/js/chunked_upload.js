@@ -0,0 +1,91 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const picker = document.getElementById('chunked-file');
+    if (!picker) {
+        return;
+    }
+    const form = picker.closest('form');
+    const uploadField = document.getElementById('id_upload');
+    const progress = document.getElementById('chunked-progress');
+    const submit = form.querySelector('button[type="submit"]');
+    const csrfToken = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+    const chunkSize = parseInt(picker.dataset.chunkSize, 10);
+    const maxRetries = 5;
+
+    function wait(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function createUpload(file) {
+        const data = new FormData();
+        data.append('filename', file.name);
+        data.append('size', file.size);
+        const response = await fetch(picker.dataset.url, {
+            method: 'POST',
+            headers: {'X-CSRFToken': csrfToken},
+            body: data,
+        });
+        if (!response.ok) {
+            throw new Error((await response.json()).error);
+        }
+        return response.json();
+    }
+
+    async function currentOffset(url) {
+        const response = await fetch(url);
+        return (await response.json()).offset;
+    }
+
+    async function sendChunks(file, upload) {
+        const url = picker.dataset.url + upload.id + '/';
+        let offset = upload.offset;
+        let retries = 0;
+        while (offset < file.size) {
+            const end = Math.min(offset + chunkSize, file.size);
+            try {
+                const response = await fetch(url, {
+                    method: 'PUT',
+                    headers: {
+                        'X-CSRFToken': csrfToken,
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': 'bytes ' + offset + '-' + (end - 1) + '/' + file.size,
+                    },
+                    body: file.slice(offset, end),
+                });
+                const status = await response.json();
+                if (!response.ok && response.status !== 409) {
+                    throw new Error(status.error);
+                }
+                offset = status.offset;
+                retries = 0;
+            } catch (error) {
+                if (++retries > maxRetries) {
+                    throw error;
+                }
+                // Ask the server how far it got and resume from there.
+                await wait(1000 * retries);
+                offset = await currentOffset(url);
+            }
+            progress.textContent = Math.floor(offset * 100 / file.size) + '%';
+        }
+    }
+
+    picker.addEventListener('change', async function() {
+        const file = picker.files[0];
+        if (!file) {
+            return;
+        }
+        submit.disabled = true;
+        uploadField.value = '';
+        progress.textContent = '0%';
+        try {
+            const upload = await createUpload(file);
+            await sendChunks(file, upload);
+            uploadField.value = upload.id;
+            progress.textContent = '100%';
+        } catch (error) {
+            progress.textContent = error.message;
+        } finally {
+            submit.disabled = false;
+        }
+    });
+});